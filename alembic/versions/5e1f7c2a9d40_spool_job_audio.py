@@ -0,0 +1,32 @@
+"""Spool job audio to disk
+
+Revision ID: 5e1f7c2a9d40
+Revises: bacc0d94521c
+Create Date: 2026-10-18 18:40:12.215903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1f7c2a9d40'
+down_revision: Union[str, None] = 'bacc0d94521c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('transcription_jobs') as batch_op:
+        batch_op.add_column(sa.Column('audio_path', sa.String(), nullable=True))
+        batch_op.drop_column('audio')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('transcription_jobs') as batch_op:
+        batch_op.add_column(sa.Column('audio', sa.LargeBinary(), nullable=True))
+        batch_op.drop_column('audio_path')
@@ -0,0 +1,76 @@
+"""
+Measure how long it takes to import the API routes, and how much memory that
+costs, for each AUDIO_SERVICE_ROLES configuration. Every sample runs in a
+fresh interpreter so nothing is already imported.
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --roles tts,voices --repeat 10 --max-seconds 1.5
+
+Exits non-zero if any configuration is slower than --max-seconds (median),
+or if a configuration without the stt role imports torch or whisper.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import sys, time, json, resource
+started = time.perf_counter()
+from routes import api_router
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "routes": len(api_router.routes),
+    "heavy_modules": sorted(name for name in ("torch", "whisper", "numpy") if name in sys.modules),
+}))
+"""
+
+DEFAULT_ROLES = ["tts,stt,voices", "tts,voices", "tts", "voices", "stt"]
+
+
+def sample(roles: str) -> dict:
+    env = dict(os.environ, AUDIO_SERVICE_ROLES=roles, TESTING="1")
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Import failed for roles={roles}:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--roles", action="append", help="Role set to measure (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per role set")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail if a median exceeds this")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'roles':<16} {'median s':>9} {'max s':>7} {'rss MB':>8} {'routes':>7}  heavy modules")
+    for roles in args.roles or DEFAULT_ROLES:
+        samples = [sample(roles) for _ in range(args.repeat)]
+        seconds = [s["seconds"] for s in samples]
+        median = statistics.median(seconds)
+        last = samples[-1]
+        print(
+            f"{roles:<16} {median:>9.3f} {max(seconds):>7.3f} {last['max_rss_mb']:>8.0f} "
+            f"{last['routes']:>7}  {', '.join(last['heavy_modules']) or '-'}"
+        )
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f"  FAIL: median {median:.3f}s exceeds {args.max_seconds}s")
+            failed = True
+        if "stt" not in roles and {"torch", "whisper"} & set(last["heavy_modules"]):
+            print("  FAIL: the STT stack was imported without the stt role")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Compare Whisper precisions on CPU: word error rate, latency and memory.
+Each precision runs in its own interpreter so peak RSS is not shared.
+
+The sample set is a JSONL manifest, one {"audio": "...", "text": "..."} per
+line, with audio paths relative to the manifest and the reference
+transcript in "text". No audio is bundled with the repository; point
+--manifest at a local set (a few minutes of representative recordings).
+
+    python benchmarks/whisper_precision.py --manifest samples/manifest.jsonl
+    python benchmarks/whisper_precision.py --manifest samples/manifest.jsonl --model small --threads 8
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MANIFEST = os.path.join(REPO_ROOT, "benchmarks", "samples", "manifest.jsonl")
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def normalize(text: str) -> list:
+    return _WORD_RE.findall(text.lower())
+
+
+def word_errors(reference: list, hypothesis: list) -> int:
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def load_manifest(path: str) -> list:
+    base = os.path.dirname(os.path.abspath(path))
+    samples = []
+    with open(path) as manifest:
+        for line in manifest:
+            if line.strip():
+                sample = json.loads(line)
+                sample["audio"] = os.path.join(base, sample["audio"])
+                samples.append(sample)
+    return samples
+
+
+def run_worker(args):
+    """Transcribe the whole manifest with one precision and print a JSON summary"""
+    sys.path.insert(0, REPO_ROOT)
+    from functions.audio import SAMPLE_RATE, decode_audio
+    from functions.transcription import get_whisper_model
+
+    samples = load_manifest(args.manifest)
+    started = time.perf_counter()
+    model = get_whisper_model(args.model, device="cpu", precision=args.precision)
+    load_seconds = time.perf_counter() - started
+
+    errors = words = 0
+    audio_seconds = inference_seconds = 0.0
+    for sample in samples:
+        with open(sample["audio"], "rb") as f:
+            audio = decode_audio(f.read(), sample["audio"])
+        started = time.perf_counter()
+        result = model.transcribe(audio, fp16=False, language=args.language)
+        inference_seconds += time.perf_counter() - started
+        audio_seconds += len(audio) / SAMPLE_RATE
+        reference = normalize(sample["text"])
+        errors += word_errors(reference, normalize(result["text"]))
+        words += len(reference)
+
+    print(json.dumps({
+        "precision": args.precision,
+        "samples": len(samples),
+        "wer": errors / max(1, words),
+        "load_seconds": load_seconds,
+        "inference_seconds": inference_seconds,
+        "rtf": inference_seconds / max(audio_seconds, 1e-9),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--model", default="turbo")
+    parser.add_argument("--language", default=None, help="Skip language detection")
+    parser.add_argument("--precisions", default="fp32,int8")
+    parser.add_argument("--threads", type=int, default=0, help="WHISPER_NUM_THREADS for the workers")
+    parser.add_argument("--precision", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if not os.path.exists(args.manifest):
+        sys.exit(f"Sample manifest not found: {args.manifest} (see --help for the format)")
+
+    env = dict(os.environ, WHISPER_NUM_THREADS=str(args.threads)) if args.threads else dict(os.environ)
+    results = []
+    for precision in args.precisions.split(","):
+        cmd = [sys.executable, __file__, "--worker", "--precision", precision, "--manifest", args.manifest, "--model", args.model]
+        if args.language:
+            cmd += ["--language", args.language]
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.exit(f"{precision} run failed:\n{proc.stderr}")
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'precision':<10} {'WER':>7} {'RTF':>7} {'infer s':>8} {'load s':>7} {'RSS MB':>8}")
+    for r in results:
+        print(
+            f"{r['precision']:<10} {r['wer']:>7.2%} {r['rtf']:>7.3f} {r['inference_seconds']:>8.1f} "
+            f"{r['load_seconds']:>7.1f} {r['max_rss_mb']:>8.0f}"
+        )
+    baseline = results[0]
+    for r in results[1:]:
+        print(
+            f"{r['precision']} vs {baseline['precision']}: WER {100 * (r['wer'] - baseline['wer']):+.2f} pts, "
+            f"speedup {baseline['inference_seconds'] / max(r['inference_seconds'], 1e-9):.2f}x, "
+            f"RSS {r['max_rss_mb'] - baseline['max_rss_mb']:+.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
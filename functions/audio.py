@@ -0,0 +1,335 @@
+import io
+import os
+import wave
+import asyncio
+import logging
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from typing import BinaryIO, List, Tuple, Union
+from functions.timing import stage
+
+# Constants
+SAMPLE_RATE = 16000  # Whisper works on 16 kHz mono audio
+
+
+# Raw bytes, or a seekable binary file such as a spooled upload
+AudioSource = Union[bytes, BinaryIO]
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def _decode_wav(source: BinaryIO) -> np.ndarray:
+    """
+    Decode 16 kHz PCM WAV without spawning ffmpeg.
+    Raises ValueError for anything that needs resampling or is not plain PCM.
+    """
+    # Spooled uploads are opened "rb+"; without an explicit mode wave rejects them
+    with wave.open(source, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getcomptype() != "NONE":
+            raise ValueError("WAV needs resampling or is compressed")
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 2:
+        audio = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        audio = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif width == 1:
+        audio = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return audio
+
+
+def _run_ffmpeg(input_arg: str, stdin_data: AudioSource = None) -> np.ndarray:
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", input_arg,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "-loglevel", "error", "pipe:1",
+    ]
+    if stdin_data is not None:
+        # -nostdin only disables interaction; the input still comes from pipe:0
+        cmd.remove("-nostdin")
+    if stdin_data is None:
+        proc = subprocess.run(cmd, capture_output=True)
+    elif isinstance(stdin_data, bytes):
+        proc = subprocess.run(cmd, input=stdin_data, capture_output=True)
+    else:
+        try:
+            fd = stdin_data.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # In-memory file object: there is no descriptor to hand over
+            stdin_data.seek(0)
+            proc = subprocess.run(cmd, input=stdin_data.read(), capture_output=True)
+        else:
+            # ffmpeg reads the file descriptor itself; the upload is never copied
+            # into memory. seek() only moves Python's buffered position, so the
+            # OS offset the child inherits is rewound explicitly, and restored
+            # afterwards to match what the buffered reader expects.
+            stdin_data.seek(0)
+            raw_position = os.lseek(fd, 0, os.SEEK_CUR)
+            os.lseek(fd, 0, os.SEEK_SET)
+            try:
+                proc = subprocess.run(cmd, stdin=fd, capture_output=True)
+            finally:
+                os.lseek(fd, raw_position, os.SEEK_SET)
+    if proc.returncode != 0:
+        raise AudioDecodeError(proc.stderr.decode(errors="ignore").strip())
+    return np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(content: AudioSource, filename: str = "") -> np.ndarray:
+    """
+    Decode an uploaded audio file into a float32 mono 16 kHz array
+
+    Args:
+        content: Binary content of the audio file, or a seekable file handle to it
+        filename: Original file name, only used for the container hint on fallback
+
+    Returns:
+        NumPy float32 array in the [-1, 1] range
+    """
+    if isinstance(content, bytes):
+        header = content[:12]
+    else:
+        content.seek(0)
+        header = content.read(12)
+        content.seek(0)
+
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        try:
+            return _decode_wav(io.BytesIO(content) if isinstance(content, bytes) else content)
+        except (ValueError, wave.Error, EOFError):
+            if not isinstance(content, bytes):
+                content.seek(0)
+
+    try:
+        return _run_ffmpeg("pipe:0", stdin_data=content)
+    except AudioDecodeError as pipe_error:
+        # Some containers (e.g. MP4 with the moov atom at the end) need a seekable input
+        logging.info(f"ffmpeg could not decode {filename or 'upload'} from a pipe, retrying from disk: {pipe_error}")
+
+    suffix = f".{filename.rsplit('.', 1)[-1]}" if "." in filename else ""
+    fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with stage("tempfile_write"), os.fdopen(fd, "wb") as temp_file:
+            if isinstance(content, bytes):
+                temp_file.write(content)
+            else:
+                content.seek(0)
+                shutil.copyfileobj(content, temp_file)
+        return _run_ffmpeg(temp_path)
+    finally:
+        os.unlink(temp_path)
+
+
+def estimate_duration(content: AudioSource, assumed_kbps: float = 128) -> float:
+    """
+    Audio duration in seconds without decoding: exact for WAV, otherwise
+    guessed from the size at an assumed bitrate
+    """
+    if isinstance(content, bytes):
+        header, size = content[:12], len(content)
+    else:
+        content.seek(0)
+        header = content.read(12)
+        size = content.seek(0, os.SEEK_END)
+        content.seek(0)
+
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        try:
+            source = io.BytesIO(content) if isinstance(content, bytes) else content
+            with wave.open(source, "rb") as wav:
+                return wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError):
+            pass
+        finally:
+            if not isinstance(content, bytes):
+                content.seek(0)
+    return size * 8 / (assumed_kbps * 1000)
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """Little-endian signed 16-bit PCM to float32 in the [-1, 1] range"""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class FFmpegStreamDecoder:
+    """
+    Long-lived ffmpeg process for compressed live audio (e.g. Opus in Ogg or
+    WebM). Encoded bytes are written to its stdin as they arrive; decoded
+    16 kHz mono samples are collected from stdout by a reader task.
+    """
+
+    def __init__(self):
+        self._proc = None
+        self._reader = None
+        self._decoded = bytearray()
+
+    async def start(self):
+        self._proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+            "-loglevel", "error", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            data = await self._proc.stdout.read(8192)
+            if not data:
+                return
+            self._decoded.extend(data)
+
+    async def write(self, data: bytes):
+        self._proc.stdin.write(data)
+        await self._proc.stdin.drain()
+
+    def read(self) -> np.ndarray:
+        """Samples decoded since the last call"""
+        usable = len(self._decoded) - len(self._decoded) % 2
+        data = bytes(self._decoded[:usable])
+        del self._decoded[:usable]
+        return pcm16_to_float(data)
+
+    async def finish(self) -> np.ndarray:
+        """Flush the encoder input and return the remaining samples"""
+        if self._proc.stdin.can_write_eof():
+            self._proc.stdin.write_eof()
+        await self._reader
+        await self._proc.wait()
+        return self.read()
+
+    async def close(self):
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+def frame_rms(audio: np.ndarray, frame_ms: int = 30) -> np.ndarray:
+    """RMS energy of consecutive non-overlapping frames"""
+    frame = max(1, SAMPLE_RATE * frame_ms // 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def detect_speech(
+    audio: np.ndarray,
+    margin_db: float = 12.0,
+    floor_db: float = -55.0,
+    min_speech_ms: int = 250,
+    min_silence_ms: int = 600,
+    pad_ms: int = 200
+) -> List[Tuple[int, int]]:
+    """
+    Energy-based voice activity detection. Frames louder than the noise floor
+    (10th percentile of frame energy) by margin_db count as speech; pauses
+    shorter than min_silence_ms are bridged, bursts shorter than
+    min_speech_ms are dropped, and each region is padded by pad_ms.
+
+    Args:
+        audio: float32 mono 16 kHz samples
+        margin_db: How far above the noise floor speech must be
+        floor_db: Absolute level below which a frame is always silence
+
+    Returns:
+        Sorted, non-overlapping (start_sample, end_sample) speech regions
+    """
+    frame_ms = 30
+    frame = SAMPLE_RATE * frame_ms // 1000
+    energy = frame_rms(audio, frame_ms)
+    if not len(energy):
+        return []
+
+    level = 20 * np.log10(energy + 1e-10)
+    # Never put the threshold above the loudest material minus the margin
+    threshold = max(floor_db, min(np.percentile(level, 10) + margin_db, level.max() - margin_db))
+    voiced = level > threshold
+
+    # Run boundaries: starts and ends of voiced stretches, in frames
+    edges = np.diff(np.concatenate([[0], voiced.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    regions: List[List[int]] = []
+    for start, end in zip(starts, ends):
+        if regions and (start - regions[-1][1]) * frame_ms < min_silence_ms:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    pad = SAMPLE_RATE * pad_ms // 1000
+    speech: List[Tuple[int, int]] = []
+    for start, end in regions:
+        if (end - start) * frame_ms < min_speech_ms:
+            continue
+        lo = max(0, start * frame - pad)
+        hi = min(len(audio), end * frame + pad)
+        if speech and lo <= speech[-1][1]:
+            speech[-1] = (speech[-1][0], hi)
+        else:
+            speech.append((lo, hi))
+    return speech
+
+
+def split_on_silence(
+    audio: np.ndarray,
+    chunk_seconds: float,
+    overlap_seconds: float = 2.0,
+    search_seconds: float = 10.0
+) -> List[Tuple[int, int]]:
+    """
+    Split audio into overlapping chunks whose cut points fall on the quietest
+    moment near each nominal boundary
+
+    Args:
+        audio: float32 mono 16 kHz samples
+        chunk_seconds: Nominal chunk length
+        overlap_seconds: Audio shared by neighbouring chunks on each side of a cut
+        search_seconds: How far around each nominal boundary to look for silence
+
+    Returns:
+        List of (start_sample, end_sample) pairs covering the whole input
+    """
+    frame_ms = 30
+    frame = SAMPLE_RATE * frame_ms // 1000
+    energy = frame_rms(audio, frame_ms)
+    # Smooth over ~0.5 s so a single quiet frame inside a word is not picked
+    window = max(1, 500 // frame_ms)
+    if len(energy) >= window:
+        energy = np.convolve(energy, np.ones(window) / window, mode="same")
+
+    chunk = int(chunk_seconds * SAMPLE_RATE)
+    search = int(search_seconds * SAMPLE_RATE)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+
+    cuts = [0]
+    while len(audio) - cuts[-1] > chunk + search:
+        target = cuts[-1] + chunk
+        lo = max(cuts[-1] + 1, target - search) // frame
+        hi = min(len(energy), (target + search) // frame)
+        cut = (lo + int(np.argmin(energy[lo:hi]))) * frame if hi > lo else target
+        cuts.append(max(cut, cuts[-1] + frame))
+    cuts.append(len(audio))
+
+    return [
+        (max(0, start - overlap), min(len(audio), end + overlap))
+        for start, end in zip(cuts[:-1], cuts[1:])
+    ]
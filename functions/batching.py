@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_SAMPLES, N_FRAMES, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+from functions.audio import split_on_silence
+from functions.longform import stitch_chunks
+from functions.timing import record_stage, stage
+
+# Constants
+WHISPER_BATCH_MAX_SIZE = int(os.getenv("WHISPER_BATCH_MAX_SIZE", "8"))
+WHISPER_BATCH_WAIT_MS = int(os.getenv("WHISPER_BATCH_WAIT_MS", "10"))
+WHISPER_BATCH_BEAM_SIZE = int(os.getenv("WHISPER_BATCH_BEAM_SIZE", "0"))  # 0 = greedy
+
+# Same thresholds model.transcribe uses to drop silent windows and to retry
+# failed decodes at higher temperatures
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+FALLBACK_TEMPERATURES = (0.2, 0.4, 0.6, 0.8, 1.0)
+TIME_PRECISION = 0.02  # seconds per timestamp token
+
+# Windows are cut at silences and overlap their neighbours; the longest
+# possible window (two search offsets and two overlaps) still fits in 30 s
+WINDOW_OVERLAP_SECONDS = 1.0
+WINDOW_SEARCH_SECONDS = 3.0
+WINDOW_SECONDS = N_SAMPLES / SAMPLE_RATE - 2 * (WINDOW_OVERLAP_SECONDS + WINDOW_SEARCH_SECONDS)
+
+
+class WhisperBatcher:
+    """
+    Collects 30-second mel windows from concurrent callers for a few
+    milliseconds and runs them through the encoder and decoder as one batch.
+    Callers block on the returned future from their inference thread.
+    """
+
+    def __init__(self, model_name: str, precision: str, max_size: int, max_wait_ms: int):
+        self.model_name = model_name
+        self.precision = precision
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[torch.Tensor, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"whisper-batcher-{model_name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, mel: torch.Tensor) -> Future:
+        future: Future = Future()
+        self._queue.put((mel, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            batch = [(mel, future) for mel, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._decode([mel for mel, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logging.error(f"Batched Whisper decode failed for {len(batch)} windows: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def _decode(self, mels: List[torch.Tensor]) -> List[Any]:
+        # Imported here to avoid a circular import with functions.transcription
+        from functions.transcription import get_whisper_model, model_lock
+
+        model = get_whisper_model(self.model_name, precision=self.precision)
+        fp16 = self.precision == "fp16"
+        mel_batch = torch.stack(mels).to(model.device)
+        if fp16:
+            mel_batch = mel_batch.half()
+
+        options = whisper.DecodingOptions(
+            fp16=fp16,
+            beam_size=WHISPER_BATCH_BEAM_SIZE or None,
+            without_timestamps=False,
+        )
+        # Shared by every request in the batch, so these go to the histograms only
+        with model_lock(model), torch.no_grad():
+            # Encode once for the whole batch; decode() skips the encoder for features
+            started = time.perf_counter()
+            audio_features = model.embed_audio(mel_batch)
+            record_stage("encode", time.perf_counter() - started, "whisper", self.model_name)
+            started = time.perf_counter()
+            results = whisper.decode(model, audio_features, options)
+            record_stage("decode", time.perf_counter() - started, "whisper", self.model_name)
+        logging.info(f"Decoded a batch of {len(mels)} Whisper windows")
+        return results if isinstance(results, list) else [results]
+
+
+_batchers: Dict[Tuple[str, str], WhisperBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_name: str, precision: str) -> WhisperBatcher:
+    with _batchers_lock:
+        key = (model_name, precision)
+        if key not in _batchers:
+            _batchers[key] = WhisperBatcher(model_name, precision, WHISPER_BATCH_MAX_SIZE, WHISPER_BATCH_WAIT_MS)
+        return _batchers[key]
+
+
+def _window_segments(result, tokenizer, offset: float, seek: int, length: float) -> List[Dict[str, Any]]:
+    """Split a window's decoded tokens into segments at timestamp token pairs"""
+    segments = []
+    text_tokens: List[int] = []
+    start = None
+    for token in result.tokens:
+        if token >= tokenizer.timestamp_begin:
+            timestamp = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if start is None:
+                start = timestamp
+            elif text_tokens:
+                segments.append((start, timestamp, text_tokens))
+                text_tokens, start = [], None
+            else:
+                start = timestamp
+        else:
+            text_tokens.append(token)
+
+    if text_tokens:
+        # No closing timestamp: the speech runs to the end of the window
+        segments.append((start or 0.0, length, text_tokens))
+
+    return [
+        {
+            "id": i,
+            "seek": seek,
+            "start": round(offset + seg_start, 3),
+            "end": round(offset + seg_end, 3),
+            "text": tokenizer.decode(tokens),
+            "tokens": tokens,
+            "temperature": result.temperature,
+            "avg_logprob": result.avg_logprob,
+            "compression_ratio": result.compression_ratio,
+            "no_speech_prob": result.no_speech_prob,
+        }
+        for i, (seg_start, seg_end, tokens) in enumerate(segments)
+    ]
+
+
+def _needs_fallback(result) -> bool:
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+        return False  # Silence; dropped rather than retried
+    return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def _decode_with_fallback(model, model_name: str, mel: torch.Tensor, precision: str, result):
+    """
+    Re-decode a window the greedy batch pass got wrong (repetition loops or
+    low confidence) at increasing temperatures, as model.transcribe does.
+    Runs on the caller's inference thread, outside the batch.
+    """
+    from functions.transcription import model_lock
+
+    fp16 = precision == "fp16"
+    mel = mel.to(model.device)
+    if fp16:
+        mel = mel.half()
+    with stage("fallback_decode", "whisper", model_name), model_lock(model), torch.no_grad():
+        for temperature in FALLBACK_TEMPERATURES:
+            options = whisper.DecodingOptions(fp16=fp16, temperature=temperature, without_timestamps=False)
+            result = model.decode(mel, options)
+            if not _needs_fallback(result):
+                break
+    return result
+
+
+def transcribe_batched(model, model_name: str, audio: np.ndarray, precision: str) -> Dict[str, Any]:
+    """
+    Transcribe audio by submitting windows of at most 30 seconds to the
+    shared batcher. Long audio is cut at silences into overlapping windows,
+    and the overlaps are stitched so each seam is transcribed once.
+
+    Args:
+        model: Loaded Whisper model (used for its dimensions and tokenizer)
+        model_name: Whisper model name, selects the batcher
+        audio: float32 mono 16 kHz samples
+        precision: Compute precision of the model
+
+    Returns:
+        Dictionary shaped like the output of model.transcribe
+    """
+    batcher = get_batcher(model_name, precision)
+    if len(audio) <= N_SAMPLES:
+        bounds = [(0, len(audio))]
+    else:
+        bounds = split_on_silence(audio, WINDOW_SECONDS, WINDOW_OVERLAP_SECONDS, WINDOW_SEARCH_SECONDS)
+    futures = []
+    with stage("features", "whisper", model_name):
+        for start, end in bounds:
+            window = torch.from_numpy(audio[start:min(end, start + N_SAMPLES)])
+            mel = whisper.pad_or_trim(whisper.log_mel_spectrogram(window, model.dims.n_mels), N_FRAMES)
+            futures.append((start, len(window), mel, batcher.submit(mel)))
+
+    windows: List[Dict[str, Any]] = []
+    languages: Counter = Counter()
+    for start, length, mel, future in futures:
+        result = future.result()
+        if _needs_fallback(result):
+            result = _decode_with_fallback(model, model_name, mel, precision, result)
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            windows.append({"segments": []})
+            continue
+        languages[result.language] += 1
+        tokenizer = get_tokenizer(
+            model.is_multilingual,
+            num_languages=model.num_languages,
+            language=result.language,
+            task="transcribe",
+        )
+        seek = start // (SAMPLE_RATE // 100)  # mel frames, as in model.transcribe
+        windows.append({"segments": _window_segments(result, tokenizer, start / SAMPLE_RATE, seek, length / SAMPLE_RATE)})
+
+    # Keep each overlap's segments from one side only and renumber them
+    segments = stitch_chunks(windows, bounds)
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": languages.most_common(1)[0][0] if languages else "en",
+    }
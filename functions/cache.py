@@ -0,0 +1,137 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from prometheus_client import Counter
+
+# Constants
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "512"))
+TRANSCRIPTION_CACHE_DB = os.getenv("TRANSCRIPTION_CACHE_DB")  # disk tier is disabled when unset
+TRANSCRIPTION_CACHE_DISK_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_DISK_ENTRIES", "100000"))
+
+CACHE_HITS = Counter("transcription_cache_hits_total", "Transcription cache hits", ["tier"])
+CACHE_MISSES = Counter("transcription_cache_misses_total", "Transcription cache misses")
+
+
+def transcription_cache_key(content_hash: str, **options: Any) -> str:
+    """Cache key from the audio content hash plus engine, model and options"""
+    encoded = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{content_hash}:{encoded}".encode()).hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Two-tier content-addressed cache for transcription results: a bounded
+    in-memory LRU in front of an optional SQLite store. Results are kept as
+    JSON so cached entries can never be mutated by a caller.
+    """
+
+    def __init__(self, max_entries: int, db_path: Optional[str] = None, max_disk_entries: int = 0):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()  # guards the in-memory tier only
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcriptions ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_accessed_at ON transcriptions (accessed_at)")
+            self._db.commit()
+            logging.info(f"Transcription disk cache enabled at {db_path}")
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Blocking when the disk tier is enabled; use aget() on the event loop
+
+        Returns:
+            (result, tier) on a hit, where tier is "memory" or "disk"; (None, None) on a miss
+        """
+        result = self._get_memory(key)
+        if result is not None:
+            return result, "memory"
+        return self._get_disk(key)
+
+    async def aget(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """get() with the SQLite lookup run off the event loop"""
+        result = self._get_memory(key)
+        if result is not None:
+            return result, "memory"
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            encoded = self._memory.get(key)
+            if encoded is None:
+                return None
+            self._memory.move_to_end(key)
+        CACHE_HITS.labels(tier="memory").inc()
+        return json.loads(encoded)
+
+    def _get_disk(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT result FROM transcriptions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE transcriptions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+        if row is not None:
+            with self._lock:
+                self._remember(key, row[0])
+            CACHE_HITS.labels(tier="disk").inc()
+            return json.loads(row[0]), "disk"
+
+        CACHE_MISSES.inc()
+        return None, None
+
+    def set(self, key: str, result: Dict[str, Any]):
+        """Blocking when the disk tier is enabled; use aset() on the event loop"""
+        encoded = json.dumps(result, default=str)
+        with self._lock:
+            self._remember(key, encoded)
+        if self._db is not None:
+            self._set_disk(key, encoded)
+
+    async def aset(self, key: str, result: Dict[str, Any]):
+        """set() with the SQLite write run off the event loop"""
+        encoded = json.dumps(result, default=str)
+        with self._lock:
+            self._remember(key, encoded)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, encoded)
+
+    def _set_disk(self, key: str, encoded: str):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcriptions (key, result, accessed_at) VALUES (?, ?, ?)",
+                (key, encoded, time.time())
+            )
+            self._db.execute(
+                "DELETE FROM transcriptions WHERE key IN ("
+                "SELECT key FROM transcriptions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, encoded: str):
+        self._memory[key] = encoded
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+transcription_cache = TranscriptionCache(
+    TRANSCRIPTION_CACHE_SIZE,
+    TRANSCRIPTION_CACHE_DB,
+    TRANSCRIPTION_CACHE_DISK_ENTRIES
+)
@@ -0,0 +1,192 @@
+import os
+import copy
+import asyncio
+import logging
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from prometheus_client import Counter
+
+# Constants
+STREAM_FANOUT_MAX_CHUNKS = int(os.getenv("STREAM_FANOUT_MAX_CHUNKS", "64"))
+
+COALESCED_REQUESTS = Counter("coalesced_requests_total", "Requests attached to an identical in-flight job", ["kind"])
+
+
+class SingleFlight:
+    """
+    Concurrent callers with the same key share one in-flight job. The job is
+    shielded, so a caller that goes away does not cancel it for the others.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, job: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(job())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return await asyncio.shield(task)
+
+        COALESCED_REQUESTS.labels(kind=self.kind).inc()
+        result = await asyncio.shield(task)
+        # Followers get their own copy so no caller can mutate another's result
+        return copy.deepcopy(result)
+
+
+class _SharedStream:
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.base = 0  # stream index of chunks[0]; above 0 the start is gone
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.positions: Dict[int, int] = {}  # subscriber -> stream index of its next chunk
+        self.next_subscriber = 0
+        self.changed = asyncio.Condition()
+        self.drained = asyncio.Event()  # set when a subscriber advances or leaves
+        self.opened: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.producer: Optional[asyncio.Task] = None
+
+    @property
+    def end(self) -> int:
+        return self.base + len(self.chunks)
+
+    def slowest(self) -> int:
+        return min(self.positions.values(), default=self.end)
+
+    def join(self) -> int:
+        subscriber = self.next_subscriber
+        self.next_subscriber += 1
+        self.positions[subscriber] = self.base
+        return subscriber
+
+    def advance(self, subscriber: int, position: int):
+        self.positions[subscriber] = position
+        if len(self.chunks) > STREAM_FANOUT_MAX_CHUNKS:
+            # Everyone has read past these; later subscribers can no longer replay from the start
+            drop = self.slowest() - self.base
+            del self.chunks[:drop]
+            self.base += drop
+        self.drained.set()
+
+
+class StreamFanout:
+    """
+    Single-flight for streaming responses: the first request opens the
+    upstream stream, and identical concurrent requests subscribe to it. Every
+    subscriber replays the shared buffer from the start and then follows
+    live. The buffer holds at most STREAM_FANOUT_MAX_CHUNKS chunks past the
+    slowest subscriber; beyond that the producer waits for it, so backpressure
+    still reaches the upstream. Once the start has been dropped, new requests
+    open their own upstream stream. The upstream is cancelled as soon as the
+    last subscriber leaves.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._inflight: Dict[str, _SharedStream] = {}
+
+    async def subscribe(self, key: str, open_stream: Callable[[], Awaitable[AsyncIterator[bytes]]]) -> AsyncIterator[bytes]:
+        """
+        Attach to the in-flight stream for key, opening it if there is none.
+        Upstream errors while opening are raised here, before any response starts.
+        """
+        shared = self._inflight.get(key)
+        if shared is None or shared.base:
+            # A stream whose start has been dropped cannot be replayed
+            shared = _SharedStream()
+            self._inflight[key] = shared
+            subscriber = shared.join()
+            shared.producer = asyncio.create_task(self._produce(key, shared, open_stream))
+        else:
+            COALESCED_REQUESTS.labels(kind=self.kind).inc()
+            subscriber = shared.join()
+
+        try:
+            await asyncio.shield(shared.opened)
+        except BaseException:
+            self._leave(key, shared, subscriber)
+            raise
+        stream = self._follow(key, shared, subscriber)
+        # A response that is dropped before it starts iterating never runs the
+        # generator's finally; leave when it is garbage collected instead
+        weakref.finalize(stream, self._leave, key, shared, subscriber)
+        return stream
+
+    def _forget(self, key: str, shared: _SharedStream):
+        # Late arrivals now go to the cache (or start a fresh upstream request)
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+
+    def _leave(self, key: str, shared: _SharedStream, subscriber: int):
+        if shared.positions.pop(subscriber, None) is None:
+            return
+        shared.drained.set()
+        if not shared.positions and not shared.done and shared.producer is not None:
+            # Nobody is listening any more: stop paying for the upstream stream
+            shared.producer.cancel()
+            self._forget(key, shared)
+
+    async def _produce(self, key: str, shared: _SharedStream, open_stream):
+        try:
+            source = await open_stream()
+        except asyncio.CancelledError:
+            self._forget(key, shared)
+            shared.opened.cancel()
+            raise
+        except Exception as e:
+            self._forget(key, shared)
+            shared.opened.set_exception(e)
+            return
+        shared.opened.set_result(None)
+
+        try:
+            async for chunk in source:
+                async with shared.changed:
+                    shared.chunks.append(chunk)
+                    shared.changed.notify_all()
+                # Wait for the slowest subscriber instead of buffering ahead of it
+                while shared.end - shared.slowest() >= STREAM_FANOUT_MAX_CHUNKS:
+                    shared.drained.clear()
+                    await shared.drained.wait()
+                if shared.base:
+                    self._forget(key, shared)
+        except asyncio.CancelledError:
+            shared.error = ConnectionAbortedError("Upstream stream cancelled")
+            raise
+        except Exception as e:
+            logging.error(f"Shared upstream stream failed: {e}")
+            shared.error = e
+        finally:
+            self._forget(key, shared)
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            async with shared.changed:
+                shared.done = True
+                shared.changed.notify_all()
+
+    async def _follow(self, key: str, shared: _SharedStream, subscriber: int) -> AsyncIterator[bytes]:
+        index = shared.positions.get(subscriber, shared.base)
+        try:
+            while True:
+                async with shared.changed:
+                    await shared.changed.wait_for(lambda: index < shared.end or shared.done)
+                    pending = shared.chunks[index - shared.base:]
+                    finished = shared.done
+                for chunk in pending:
+                    yield chunk
+                    index += 1
+                    shared.advance(subscriber, index)
+                if finished and index >= shared.end:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+        finally:
+            self._leave(key, shared, subscriber)
+
+
+transcription_flight = SingleFlight("transcription")
+tts_fanout = StreamFanout("tts")
@@ -1,10 +1,13 @@
 import os
-import requests
+import httpx
 import logging
 from dotenv import load_dotenv
-from typing import Generator, Dict, Any
+from typing import AsyncIterator, Awaitable, BinaryIO, Dict, Any, List, Optional, Tuple, Union
 from fastapi import HTTPException
-from elevenlabs import ElevenLabs
+from circuitbreaker import CircuitBreakerError
+from functions.http_client import get_http_client
+from functions.resilience import call_upstream, retry_after_seconds
+from functions.rate_limiter import Permit, UpstreamBusy, upstream_governor
 
 # Load environment variables
 load_dotenv()
@@ -22,133 +25,296 @@ ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
 if not ELEVEN_API_KEY:
     raise ValueError("Eleven API key is missing. Please set it in the .env file.")
 
-def generate_speech(text: str, voice_id: str, output_format: str, model_id: str) -> Generator:
-    url = f"{ELEVEN_TTS_URL}/{voice_id}?output_format={output_format}"
-    
+
+def _rewind(files):
+    """Seek uploaded file handles back to the start, so a retried request resends them whole"""
+    entries = files.values() if isinstance(files, dict) else [entry for _, entry in files]
+    for entry in entries:
+        if hasattr(entry[1], "seek"):
+            entry[1].seek(0)
+    return files
+
+
+def _error_detail(e: httpx.HTTPError) -> str:
+    """Extract the ElevenLabs error detail if the response carries one"""
+    error_detail = str(e)
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            error_json = response.json()
+            if 'detail' in error_json:
+                error_detail = error_json['detail']
+        except Exception:
+            pass
+    return error_detail
+
+
+def _unavailable(e: Exception) -> HTTPException:
+    """Fast failure while ElevenLabs is unhealthy (open circuit) or our quota is exhausted"""
+    logging.warning(f"ElevenLabs call rejected: {e}")
+    if isinstance(e, UpstreamBusy):
+        return HTTPException(
+            status_code=429,
+            detail="ElevenLabs capacity exhausted, please retry later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    retry_after = max(1, e._circuit_breaker.open_remaining)
+    return HTTPException(
+        status_code=503,
+        detail="ElevenLabs is temporarily unavailable.",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+def _is_rate_limited(e: httpx.HTTPError) -> bool:
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429
+
+
+def _rate_limited(e: httpx.HTTPStatusError) -> HTTPException:
+    """Pass upstream quota errors through as 429 instead of a generic 500"""
+    return HTTPException(
+        status_code=429,
+        detail="ElevenLabs rate limit reached, please retry later.",
+        headers={"Retry-After": str(int(retry_after_seconds(e.response)) or 1)}
+    )
+
+
+async def _raise_for_status_after(request: Awaitable[httpx.Response]) -> httpx.Response:
+    response = await request
+    response.raise_for_status()
+    return response
+
+
+async def _iter_response(response: httpx.Response, permit: Permit) -> AsyncIterator[bytes]:
+    try:
+        # Chunks as they come off the socket; relay_stream decides the client chunk size
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    finally:
+        await response.aclose()
+        # The upstream generation counts against concurrency until the stream ends
+        permit.release()
+
+
+async def _open_stream(url: str, payload: Dict[str, Any], project_id: Optional[str]) -> AsyncIterator[bytes]:
+    """Open a streaming POST, failing before the first byte if upstream rejects it"""
+    client = get_http_client()
     headers = {
         "Content-Type": "application/json",
         "xi-api-key": ELEVEN_API_KEY  # API Key is kept **secret** in the backend
     }
-    
+
+    async def send(timeout: httpx.Timeout) -> httpx.Response:
+        request = client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+        response = await client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    permit = await upstream_governor.acquire(project_id, len(payload["text"]))
+    try:
+        # Nothing has been streamed to the client yet, so retrying is safe
+        response = await call_upstream("tts", send)
+    except BaseException:
+        permit.release()
+        raise
+    return _iter_response(response, permit)
+
+
+async def generate_speech(
+    text: str,
+    voice_id: str,
+    output_format: str,
+    model_id: str,
+    previous_text: Optional[str] = None,
+    next_text: Optional[str] = None,
+    project_id: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    url = f"{ELEVEN_TTS_URL}/{voice_id}?output_format={output_format}"
+
     payload = {
         "text": text,
         "model_id": model_id
     }
+    # Surrounding text keeps prosody continuous when a long text is synthesized in pieces
+    if previous_text:
+        payload["previous_text"] = previous_text
+    if next_text:
+        payload["next_text"] = next_text
 
     try:
-        response = requests.post(url, headers=headers, json=payload, stream=True)
-        response.raise_for_status()  # Ensure request was successful
-
         # Use an iterator to stream the content properly
-        return response.iter_content(chunk_size=1024)
-    except requests.exceptions.RequestException as e:
+        return await _open_stream(url, payload, project_id)
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
         logging.error(f"Error calling ElevenLabs API: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate speech.")
-    
 
-def transcribe_audio(audio_content: bytes, filename: str, model_id: str = "scribe_v1") -> Dict[str, Any]:
+
+async def transcribe_audio(
+    audio_content: Union[bytes, BinaryIO],
+    filename: str,
+    model_id: str = "scribe_v1",
+    project_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Transcribe audio to text using ElevenLabs Speech-to-Text API
-    
+
     Args:
-        audio_content: Binary content of the audio file
+        audio_content: Binary content of the audio file, or a seekable file handle to it
         filename: Name of the audio file
         model_id: Model ID to use for transcription (default: scribe_v1)
-        
+        project_id: Project the request is queued under for fair sharing of the quota
+
     Returns:
         Dictionary with transcription result
     """
     headers = {
         "xi-api-key": ELEVEN_API_KEY
     }
-    
+
     files = {
         "file": (filename, audio_content, "audio/mpeg")
     }
-    
+
     data = {
         "model_id": model_id
     }
-    
+
     try:
-        response = requests.post(
-            ELEVEN_STT_URL,
-            headers=headers,
-            files=files,
-            data=data
-        )
-        
-        response.raise_for_status()
+        async with upstream_governor.slot(project_id):
+            response = await call_upstream("stt", lambda timeout: _raise_for_status_after(
+                get_http_client().post(ELEVEN_STT_URL, headers=headers, files=_rewind(files), data=data, timeout=timeout)
+            ))
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
         logging.error(f"Error calling ElevenLabs Speech-to-Text API: {e}")
-        error_detail = str(e)
-        
-        # Try to extract more detailed error information if available
-        if hasattr(e, 'response') and e.response:
-            try:
-                error_json = e.response.json()
-                if 'detail' in error_json:
-                    error_detail = error_json['detail']
-            except:
-                pass
-                
-        raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {error_detail}")
-
-def get_voice_settings(voice_id: str) -> Dict[str, Any]:
+        raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {_error_detail(e)}")
+
+async def add_voice(name: str, files: List[Tuple[str, Union[bytes, BinaryIO]]], project_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create an instant voice clone from audio samples
+
+    Args:
+        name: Name of the new voice
+        files: (filename, content or file handle) pairs of the voice samples
+        project_id: Project the request is queued under for fair sharing of the quota
+
+    Returns:
+        Dictionary with the new voice_id
+    """
+    headers = {
+        "xi-api-key": ELEVEN_API_KEY
+    }
+
+    try:
+        # Creating a voice is not idempotent, so it is never retried
+        async with upstream_governor.slot(project_id):
+            response = await call_upstream("voices", lambda timeout: _raise_for_status_after(
+                get_http_client().post(
+                    ELEVEN_URL,
+                    headers=headers,
+                    data={"name": name},
+                    files=_rewind([("files", (filename, content)) for filename, content in files]),
+                    timeout=timeout
+                )
+            ), idempotent=False)
+        return response.json()
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
+        logging.error(f"Error calling ElevenLabs API: {e}")
+        raise HTTPException(status_code=500, detail=f"Error calling ElevenLabs: {_error_detail(e)}")
+
+async def get_voice_settings(voice_id: str) -> Dict[str, Any]:
     url = f"{ELEVEN_API_BASE_URL}/voices/{voice_id}/settings"
-    
+
     headers = {
         "xi-api-key": ELEVEN_API_KEY
     }
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        async with upstream_governor.slot():
+            response = await call_upstream("voices", lambda timeout: _raise_for_status_after(
+                get_http_client().get(url, headers=headers, timeout=timeout)
+            ))
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
         logging.error(f"Error calling ElevenLabs API: {e}")
         raise HTTPException(status_code=500, detail="Failed to get voice settings.")
 
-def update_voice_settings(voice_id: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+async def update_voice_settings(voice_id: str, settings: Dict[str, Any]) -> Dict[str, Any]:
     url = f"{ELEVEN_API_BASE_URL}/voices/{voice_id}/settings/edit"
-    
+
     headers = {
         "Content-Type": "application/json",
         "xi-api-key": ELEVEN_API_KEY
     }
-    
+
     try:
-        response = requests.post(url, headers=headers, json=settings)
-        response.raise_for_status()
+        async with upstream_governor.slot():
+            response = await call_upstream("voices", lambda timeout: _raise_for_status_after(
+                get_http_client().post(url, headers=headers, json=settings, timeout=timeout)
+            ))
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
         logging.error(f"Error calling ElevenLabs API: {e}")
         raise HTTPException(status_code=500, detail="Failed to update voice settings.")
 
-def delete_voice_eleven(voice_id: str) -> Dict[str, Any]:
+async def delete_voice_eleven(voice_id: str) -> Dict[str, Any]:
     url = f"{ELEVEN_API_BASE_URL}/voices/{voice_id}"
-    
+
     headers = {
         "xi-api-key": ELEVEN_API_KEY
     }
-    
+
     try:
-        response = requests.delete(url, headers=headers)
-        response.raise_for_status()
+        async with upstream_governor.slot():
+            response = await call_upstream("voices", lambda timeout: _raise_for_status_after(
+                get_http_client().delete(url, headers=headers, timeout=timeout)
+            ))
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
         logging.error(f"Error calling ElevenLabs API: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete voice.")
 
-def stream_speech(text: str, voice_id: str = "LPJ71OSKKaosXFK91Zee", model_id: str = "eleven_multilingual_v2", output_format: str = "mp3_44100_128"):
+async def stream_speech(text: str, voice_id: str = "LPJ71OSKKaosXFK91Zee", model_id: str = "eleven_multilingual_v2", output_format: str = "mp3_44100_128", project_id: Optional[str] = None) -> AsyncIterator[bytes]:
+    url = f"{ELEVEN_TTS_URL}/{voice_id}/stream?output_format={output_format}"
+
+    payload = {
+        "text": text,
+        "model_id": model_id
+    }
+
     try:
-        client = ElevenLabs(api_key=ELEVEN_API_KEY)
-        audio_stream = client.text_to_speech.convert_as_stream(
-            text=text,
-            voice_id=voice_id,
-            model_id=model_id,
-            output_format=output_format
-        )
-        return audio_stream
+        return await _open_stream(url, payload, project_id)
+    except (CircuitBreakerError, UpstreamBusy) as e:
+        raise _unavailable(e)
+    except httpx.HTTPStatusError as e:
+        if _is_rate_limited(e):
+            raise _rate_limited(e)
+        raise HTTPException(status_code=500, detail=f"Error streaming audio: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error streaming audio: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error streaming audio: {str(e)}")
@@ -0,0 +1,106 @@
+import os
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+from prometheus_client import Counter, Gauge
+
+# Constants
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "16"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+
+INFERENCE_RUNNING = Gauge("inference_running", "Inference jobs currently executing")
+INFERENCE_QUEUED = Gauge("inference_queued", "Inference jobs waiting for a worker")
+INFERENCE_REJECTED = Counter("inference_rejected_total", "Inference jobs rejected because the queue was full")
+
+
+class InferenceQueueFull(Exception):
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for blocking model inference so it never runs on the
+    event loop. At most `workers` jobs run and `queue_depth` more may wait;
+    anything beyond that is rejected with InferenceQueueFull. Jobs that use
+    the same Whisper model instance still run one after another (see
+    transcription.model_lock); workers overlap across models and with decoding.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.max_queue_depth = queue_depth
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending - self._running
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue_depth:
+                INFERENCE_REJECTED.inc()
+                raise InferenceQueueFull()
+            self._pending += 1
+            INFERENCE_QUEUED.set(self.queue_depth)
+
+    def _execute(self, fn: Callable, *args, **kwargs):
+        with self._lock:
+            self._running += 1
+            INFERENCE_RUNNING.set(self._running)
+            INFERENCE_QUEUED.set(self.queue_depth)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                INFERENCE_RUNNING.set(self._running)
+                INFERENCE_QUEUED.set(self.queue_depth)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function on the inference pool and await its result
+
+        Raises:
+            InferenceQueueFull: if every worker is busy and the queue is full
+        """
+        self._reserve()
+        # Carry context variables (request-scoped state) into the worker thread
+        ctx = contextvars.copy_context()
+        try:
+            future = self._pool.submit(ctx.run, self._execute, fn, *args, **kwargs)
+        except Exception:
+            self._release_reservation()
+            raise
+        future.add_done_callback(self._release_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _release_if_cancelled(self, future: Future):
+        # A job cancelled while still queued never reaches _execute; give its slot back
+        if future.cancelled():
+            self._release_reservation()
+
+    def _release_reservation(self):
+        with self._lock:
+            self._pending -= 1
+            INFERENCE_QUEUED.set(self.queue_depth)
+
+    def shutdown(self):
+        logging.info("Shutting down inference executor")
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH)
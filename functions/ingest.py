@@ -0,0 +1,170 @@
+import os
+import shutil
+import hashlib
+import zipfile
+import tempfile
+from typing import BinaryIO, List, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from functions.timing import stage
+
+# Constants
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "16"))
+MAX_TRANSCRIBE_UPLOAD_MB = int(os.getenv("MAX_TRANSCRIBE_UPLOAD_MB", "512"))
+MAX_VOICE_UPLOAD_MB = int(os.getenv("MAX_VOICE_UPLOAD_MB", "100"))
+INGEST_CHUNK_SIZE = 1024 * 1024
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+
+# Request body limits by path prefix; the longest matching prefix wins
+UPLOAD_LIMITS = {
+    "/speech/transcribe": MAX_TRANSCRIBE_UPLOAD_MB * 2**20,
+    "/voices": MAX_VOICE_UPLOAD_MB * 2**20,
+}
+
+
+def upload_limit(path: str) -> int:
+    matches = [prefix for prefix in UPLOAD_LIMITS if path.startswith(prefix)]
+    return UPLOAD_LIMITS[max(matches, key=len)] if matches else MAX_UPLOAD_MB * 2**20
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects oversized request bodies before they are buffered. A declared
+    Content-Length over the limit gets a 413 straight away; otherwise the
+    body is counted as it streams in, and the request fails with 413 as soon
+    as it crosses the limit (multipart uploads are spooled to disk by
+    Starlette, so nothing beyond the limit is ever written).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        limit = upload_limit(scope["path"])
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=413, content={"detail": f"Request body exceeds {limit // 2**20} MB"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing, so FastAPI turns it into the response
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {limit // 2**20} MB")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _digest(file: BinaryIO) -> Tuple[str, int]:
+    file.seek(0)
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: file.read(INGEST_CHUNK_SIZE), b""):
+        sha256.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return sha256.hexdigest(), size
+
+
+async def hash_file(file: BinaryIO) -> Tuple[str, int]:
+    """
+    SHA-256 and size of a file, read in chunks off the event loop.
+    The file is left rewound so it can be handed on as a file handle.
+    """
+    with stage("hash"):
+        return await run_in_threadpool(_digest, file)
+
+
+async def hash_upload(upload: UploadFile) -> Tuple[str, int]:
+    return await hash_file(upload.file)
+
+
+def duplicate_handle(file: BinaryIO) -> BinaryIO:
+    """
+    A handle to the same spooled file that stays readable after the original
+    is closed (FastAPI closes uploads when the request finishes). The caller
+    closes it.
+    """
+    file.seek(0)
+    return os.fdopen(os.dup(file.fileno()), "rb")
+
+
+def _is_zip(upload: UploadFile) -> bool:
+    if upload.content_type in ("application/zip", "application/x-zip-compressed") or (upload.filename or "").lower().endswith(".zip"):
+        return zipfile.is_zipfile(upload.file)
+    return False
+
+
+def _extract_zip(upload: UploadFile) -> List[Tuple[str, BinaryIO]]:
+    """Unpack archive members into anonymous temp files, one member at a time"""
+    upload.file.seek(0)
+    entries = []
+    try:
+        return _extract_members(upload, entries)
+    except BaseException:
+        for _, file in entries:
+            file.close()
+        raise
+
+
+def _extract_members(upload: UploadFile, entries: List[Tuple[str, BinaryIO]]) -> List[Tuple[str, BinaryIO]]:
+    with zipfile.ZipFile(upload.file) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            if len(entries) > BATCH_MAX_FILES:
+                break  # expand_uploads rejects the batch
+            if member.file_size > MAX_TRANSCRIBE_UPLOAD_MB * 2**20:
+                raise HTTPException(status_code=413, detail=f"{name} exceeds {MAX_TRANSCRIBE_UPLOAD_MB} MB uncompressed")
+            target = tempfile.TemporaryFile()
+            entries.append((name, target))
+            with archive.open(member) as source:
+                shutil.copyfileobj(source, target, INGEST_CHUNK_SIZE)
+            target.seek(0)
+    return entries
+
+
+async def expand_uploads(uploads: List[UploadFile]) -> Tuple[List[Tuple[str, BinaryIO]], List[BinaryIO]]:
+    """
+    Flatten uploaded files and zip archives into (filename, file handle) items
+
+    Returns:
+        The items (at most BATCH_MAX_FILES), and the handles the caller must close
+
+    Raises:
+        HTTPException: 413 if there are more than BATCH_MAX_FILES items
+    """
+    items: List[Tuple[str, BinaryIO]] = []
+    temp_files: List[BinaryIO] = []
+    try:
+        for upload in uploads:
+            if _is_zip(upload):
+                extracted = await run_in_threadpool(_extract_zip, upload)
+                temp_files.extend(file for _, file in extracted)
+                items.extend(extracted)
+            else:
+                # FastAPI closes the uploads when the handler returns, before a
+                # streamed response is produced; a duplicated descriptor keeps
+                # the spooled file readable without copying it
+                handle = duplicate_handle(upload.file)
+                temp_files.append(handle)
+                items.append((upload.filename, handle))
+            if len(items) > BATCH_MAX_FILES:
+                raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_FILES} files")
+    except BaseException:
+        for file in temp_files:
+            file.close()
+        raise
+    return items, temp_files
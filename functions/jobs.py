@@ -0,0 +1,360 @@
+import os
+import uuid
+import socket
+import shutil
+import asyncio
+import logging
+import tempfile
+import ipaddress
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Optional, Set
+from urllib.parse import urlsplit
+from uuid import UUID
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+import database
+from models.models import TranscriptionJob
+from functions.http_client import get_http_client
+from functions.inference_executor import INFERENCE_RETRY_AFTER
+from functions.transcription import transcribe_with_fallback
+
+# Constants
+TRANSCRIPTION_JOB_WORKERS = int(os.getenv("TRANSCRIPTION_JOB_WORKERS", "2"))
+TRANSCRIPTION_JOB_POLL_INTERVAL = float(os.getenv("TRANSCRIPTION_JOB_POLL_INTERVAL", "1"))
+TRANSCRIPTION_JOB_LEASE_SECONDS = int(os.getenv("TRANSCRIPTION_JOB_LEASE_SECONDS", "60"))
+TRANSCRIPTION_JOB_MAX_ATTEMPTS = int(os.getenv("TRANSCRIPTION_JOB_MAX_ATTEMPTS", "3"))
+WEBHOOK_ATTEMPTS = int(os.getenv("TRANSCRIPTION_WEBHOOK_ATTEMPTS", "3"))
+WEBHOOK_TIMEOUT = float(os.getenv("TRANSCRIPTION_WEBHOOK_TIMEOUT", "10"))
+# Where queued audio waits for a worker; must be shared by every process that runs workers
+TRANSCRIPTION_JOB_SPOOL_DIR = os.getenv(
+    "TRANSCRIPTION_JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "audio_service_jobs")
+)
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_COMPLETED = "completed"
+JOB_STATUS_FAILED = "failed"
+
+JOBS_FINISHED = Counter("transcription_jobs_finished_total", "Transcription jobs that reached a final state", ["status"])
+JOBS_ACTIVE = Gauge("transcription_jobs_active", "Transcription jobs currently being processed")
+WEBHOOK_FAILURES = Counter("transcription_webhook_failures_total", "Job callbacks that could not be delivered")
+
+
+class InvalidCallbackUrl(ValueError):
+    pass
+
+
+def validate_callback_url(url: str):
+    """
+    Only public http(s) endpoints may receive callbacks, so a job cannot be
+    used to make the service call its own network. Blocking (resolves DNS).
+
+    Raises:
+        InvalidCallbackUrl: for other schemes, or a host that resolves to a
+            loopback, link-local, private or otherwise reserved address
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise InvalidCallbackUrl("callback_url must be an http(s) URL")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or None)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise InvalidCallbackUrl(f"callback_url host cannot be resolved: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise InvalidCallbackUrl("callback_url must point to a public address")
+
+
+def _remove_audio(path: Optional[str]):
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def submit_job(
+    db: Session,
+    audio: BinaryIO,
+    filename: str,
+    options: Dict[str, Any],
+    callback_url: Optional[str] = None,
+    project_id: Optional[str] = None
+) -> TranscriptionJob:
+    """
+    Spool the audio to TRANSCRIPTION_JOB_SPOOL_DIR and persist a queued job
+    pointing at it; a worker picks it up from the table. Blocking.
+    """
+    os.makedirs(TRANSCRIPTION_JOB_SPOOL_DIR, exist_ok=True)
+    audio_path = os.path.join(TRANSCRIPTION_JOB_SPOOL_DIR, f"{uuid.uuid4().hex}.audio")
+    audio.seek(0)
+    with open(audio_path, "wb") as spooled:
+        shutil.copyfileobj(audio, spooled, 1024 * 1024)
+
+    job = TranscriptionJob(
+        status=JOB_STATUS_QUEUED,
+        progress=0.0,
+        filename=filename,
+        audio_path=audio_path,
+        options=options,
+        callback_url=callback_url,
+        project_id=project_id,
+    )
+    try:
+        db.add(job)
+        db.commit()
+    except Exception:
+        _remove_audio(audio_path)
+        raise
+    db.refresh(job)
+    return job
+
+
+def _claim_next_job() -> Optional[Dict[str, Any]]:
+    """
+    Take the oldest queued job, or a running job whose worker's lease has
+    expired. The conditional UPDATE makes the claim atomic across workers and
+    processes on both Postgres and SQLite.
+    """
+    db = database.SessionLocal()
+    try:
+        now = datetime.utcnow()
+        claimable = or_(
+            TranscriptionJob.status == JOB_STATUS_QUEUED,
+            (TranscriptionJob.status == JOB_STATUS_RUNNING) & (TranscriptionJob.locked_until < now),
+        )
+        job = (
+            db.query(TranscriptionJob)
+            .filter(claimable)
+            .order_by(TranscriptionJob.created_at)
+            .first()
+        )
+        if job is None:
+            return None
+
+        if job.attempts >= TRANSCRIPTION_JOB_MAX_ATTEMPTS:
+            # The job keeps taking its worker down with it; stop retrying it
+            job.status = JOB_STATUS_FAILED
+            job.error = "Job abandoned after repeated worker failures"
+            _remove_audio(job.audio_path)
+            job.audio_path = None
+            job.finished_at = now
+            db.commit()
+            JOBS_FINISHED.labels(status=JOB_STATUS_FAILED).inc()
+            return None
+
+        claimed = db.execute(
+            update(TranscriptionJob)
+            .where(TranscriptionJob.id == job.id, TranscriptionJob.attempts == job.attempts, claimable)
+            .values(
+                status=JOB_STATUS_RUNNING,
+                attempts=job.attempts + 1,
+                locked_until=now + timedelta(seconds=TRANSCRIPTION_JOB_LEASE_SECONDS),
+                started_at=now,
+            )
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return None  # Another worker got there first
+
+        db.refresh(job)
+        return {
+            "id": job.id,
+            "audio_path": job.audio_path,
+            "filename": job.filename,
+            "options": dict(job.options or {}),
+            "project_id": job.project_id,
+        }
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: UUID, progress: float):
+    db = database.SessionLocal()
+    try:
+        db.execute(
+            update(TranscriptionJob)
+            .where(TranscriptionJob.id == job_id, TranscriptionJob.status == JOB_STATUS_RUNNING)
+            .values(
+                progress=progress,
+                locked_until=datetime.utcnow() + timedelta(seconds=TRANSCRIPTION_JOB_LEASE_SECONDS),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _requeue(job_id: UUID):
+    db = database.SessionLocal()
+    try:
+        job = db.get(TranscriptionJob, job_id)
+        # Not the job's fault, so the attempt does not count
+        job.status = JOB_STATUS_QUEUED
+        job.attempts = max(0, job.attempts - 1)
+        job.locked_until = None
+        job.progress = 0.0
+        db.commit()
+    finally:
+        db.close()
+
+
+def _finish(job_id: UUID, result: Optional[Dict[str, Any]], error: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Store the outcome and return the webhook payload, if a callback was requested"""
+    db = database.SessionLocal()
+    try:
+        job = db.get(TranscriptionJob, job_id)
+        job.status = JOB_STATUS_FAILED if error else JOB_STATUS_COMPLETED
+        job.progress = 1.0 if not error else job.progress
+        job.result = result
+        job.error = error
+        _remove_audio(job.audio_path)
+        job.audio_path = None
+        job.locked_until = None
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        JOBS_FINISHED.labels(status=job.status).inc()
+
+        if not job.callback_url:
+            return None
+        payload = {"job_id": str(job.id), "status": job.status}
+        if error:
+            payload["error"] = error
+        else:
+            payload["result"] = result
+        return {"url": job.callback_url, "payload": payload}
+    finally:
+        db.close()
+
+
+async def _send_webhook(url: str, payload: Dict[str, Any]):
+    try:
+        # Checked again at delivery: the host may resolve elsewhere by now
+        await asyncio.to_thread(validate_callback_url, url)
+    except InvalidCallbackUrl as e:
+        logging.warning(f"Not delivering the webhook for job {payload['job_id']}: {e}")
+        WEBHOOK_FAILURES.inc()
+        return
+
+    client = get_http_client()
+    for attempt in range(WEBHOOK_ATTEMPTS):
+        try:
+            response = await client.post(url, json=payload, timeout=WEBHOOK_TIMEOUT)
+            response.raise_for_status()
+            return
+        except Exception as e:
+            logging.warning(f"Webhook for job {payload['job_id']} failed (attempt {attempt + 1}): {e}")
+            if attempt < WEBHOOK_ATTEMPTS - 1:
+                await asyncio.sleep(2 ** attempt)
+    WEBHOOK_FAILURES.inc()
+
+
+class TranscriptionJobWorkers:
+    """
+    Background workers that drain the transcription_jobs table. Jobs are
+    leased rather than locked, so a job whose worker dies is picked up again
+    once its lease runs out. Inference itself runs on the shared inference
+    executor, so jobs and synchronous requests compete for the same cores.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._tasks = []
+        self._webhooks: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self.workers <= 0:
+            logging.info("Transcription job workers disabled")
+            return
+        logging.info(f"Starting {self.workers} transcription job workers")
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in [*self._tasks, *self._webhooks]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._webhooks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(_claim_next_job)
+            except Exception as e:
+                logging.error(f"Failed to claim transcription job: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(TRANSCRIPTION_JOB_POLL_INTERVAL)
+                continue
+            JOBS_ACTIVE.inc()
+            try:
+                await self._process(job)
+            finally:
+                JOBS_ACTIVE.dec()
+
+    async def _process(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        options = job["options"]
+        state = {"progress": 0.0}
+
+        def report(fraction: float):
+            # Called from the inference thread; the heartbeat persists it
+            state["progress"] = fraction
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(TRANSCRIPTION_JOB_LEASE_SECONDS / 3)
+                try:
+                    await asyncio.to_thread(_heartbeat, job_id, state["progress"])
+                except Exception as e:
+                    logging.warning(f"Heartbeat for job {job_id} failed: {e}")
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        result = None
+        error = None
+        audio = None
+        try:
+            audio = await asyncio.to_thread(open, job["audio_path"], "rb")
+            result = await transcribe_with_fallback(
+                audio_contents=audio,
+                filenames=job["filename"],
+                whisper_model=options["whisper_model"],
+                eleven_model=options["eleven_model"],
+                long_form=options.get("long_form", False),
+                vad=options.get("vad"),
+                project_id=job["project_id"],
+                progress=report,
+                partial=True
+            )
+            if result.pop("status") == "error":
+                if result["status_code"] == 503:
+                    # Synchronous traffic kept the executor full; give the job back and wait
+                    heartbeat_task.cancel()
+                    await asyncio.to_thread(_requeue, job_id)
+                    await asyncio.sleep(INFERENCE_RETRY_AFTER)
+                    return
+                error, result = result["error"], None
+            else:
+                result.pop("filename", None)
+        except HTTPException as e:
+            error = str(e.detail)
+        except Exception as e:
+            logging.error(f"Transcription job {job_id} failed: {e}")
+            error = str(e)
+        finally:
+            heartbeat_task.cancel()
+            if audio is not None:
+                audio.close()
+
+        callback = await asyncio.to_thread(_finish, job_id, result, error)
+        logging.info(f"Transcription job {job_id} finished: {'failed' if error else 'completed'}")
+        if callback:
+            # Delivery retries with backoff; the worker moves on to the next job meanwhile
+            webhook = asyncio.create_task(_send_webhook(callback["url"], callback["payload"]))
+            self._webhooks.add(webhook)
+            webhook.add_done_callback(self._webhooks.discard)
+
+
+job_workers = TranscriptionJobWorkers(TRANSCRIPTION_JOB_WORKERS)
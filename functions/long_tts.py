@@ -0,0 +1,201 @@
+import os
+import re
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional
+from functions.eleven_api import generate_speech
+
+# Constants
+LONG_TTS_MAX_CHUNK_CHARS = int(os.getenv("LONG_TTS_MAX_CHUNK_CHARS", "400"))
+LONG_TTS_PARALLELISM = int(os.getenv("LONG_TTS_PARALLELISM", "4"))
+CONTEXT_CHARS = 200  # previous/next text sent upstream for prosody continuity
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# MPEG audio Layer III tables, indexed by the header fields
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+
+def supports_chunked_synthesis(output_format: str) -> bool:
+    """Formats whose streams can be concatenated: MP3 on frame boundaries, raw PCM and u-law"""
+    return output_format.startswith(("mp3_", "pcm_", "ulaw_"))
+
+
+def split_text(text: str, max_chars: int = LONG_TTS_MAX_CHUNK_CHARS) -> List[str]:
+    """
+    Split text at paragraph and sentence boundaries into chunks of at most
+    max_chars (a single longer sentence stays whole). The first chunk is a
+    single sentence so the first audio arrives as early as possible.
+    """
+    chunks: List[str] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        current = ""
+        for sentence in _SENTENCE_RE.split(paragraph.strip()):
+            if not sentence:
+                continue
+            if not chunks and not current:
+                chunks.append(sentence)
+                continue
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def _mp3_frame_length(data: bytes, pos: int) -> int:
+    """Length of the MP3 frame starting at pos, or 0 if there is no valid header"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return 0
+    version = (data[pos + 1] >> 3) & 0x03
+    layer = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = (data[pos + 2] >> 4) & 0x0F
+    sample_rate_index = (data[pos + 2] >> 2) & 0x03
+    padding = (data[pos + 2] >> 1) & 0x01
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return 0
+    bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    samples_factor = 144 if version == 3 else 72
+    return samples_factor * bitrate // sample_rate + padding
+
+
+def _trim_mp3(data: bytes, first: bool) -> bytes:
+    """
+    Cut a rendered MP3 down to whole audio frames so chunks can be concatenated.
+    Drops ID3 tags (except the first chunk's leading tag), the Xing/Info
+    frame that would announce a wrong duration, and any trailing partial frame.
+    """
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        tag_end = 10 + size + (10 if data[5] & 0x10 else 0)
+        head = data[:tag_end] if first else b""
+        start = tag_end
+    else:
+        head = b""
+
+    while start < len(data) and not _mp3_frame_length(data, start):
+        start += 1
+
+    frames = []
+    pos = start
+    while True:
+        length = _mp3_frame_length(data, pos)
+        if not length or pos + length > len(data):
+            break
+        frame = data[pos:pos + length]
+        if not frames and (b"Xing" in frame[:64] or b"Info" in frame[:64]):
+            pos += length
+            continue
+        frames.append(frame)
+        pos += length
+
+    if not frames:
+        return data if first else b""
+    return head + b"".join(frames)
+
+
+def _join_chunk(data: bytes, output_format: str, first: bool) -> bytes:
+    if output_format.startswith("mp3_"):
+        return _trim_mp3(data, first)
+    if output_format.startswith("pcm_"):
+        # 16-bit samples: never split one across chunk boundaries
+        return data[:len(data) - len(data) % 2]
+    return data
+
+
+async def _synthesize(
+    text: str,
+    voice_id: str,
+    output_format: str,
+    model_id: str,
+    previous_text: Optional[str],
+    next_text: Optional[str],
+    project_id: Optional[str],
+    semaphore: asyncio.Semaphore
+) -> bytes:
+    async with semaphore:
+        stream = await generate_speech(
+            text=text,
+            voice_id=voice_id,
+            output_format=output_format,
+            model_id=model_id,
+            previous_text=previous_text,
+            next_text=next_text,
+            project_id=project_id
+        )
+        return b"".join([chunk async for chunk in stream])
+
+
+async def synthesize_long_text(
+    text: str,
+    voice_id: str,
+    output_format: str,
+    model_id: str,
+    project_id: Optional[str] = None,
+    parallelism: int = LONG_TTS_PARALLELISM
+) -> AsyncIterator[bytes]:
+    """
+    Synthesize long text as concurrent sentence-level requests and stream the
+    audio back in order. Waits for the first chunk so upstream errors are
+    raised before the response starts.
+
+    Args:
+        text: Text to synthesize
+        voice_id: ElevenLabs voice
+        output_format: ElevenLabs output format (see supports_chunked_synthesis)
+        model_id: ElevenLabs model
+        project_id: Project the upstream requests are queued under
+        parallelism: Maximum concurrent upstream requests
+
+    Returns:
+        Async iterator over the concatenated audio
+    """
+    chunks = split_text(text) or [text]
+    logging.info(f"Synthesizing {len(text)} characters as {len(chunks)} chunks")
+    semaphore = asyncio.Semaphore(parallelism)
+    tasks = [
+        asyncio.create_task(_synthesize(
+            chunk,
+            voice_id,
+            output_format,
+            model_id,
+            " ".join(chunks[:i])[-CONTEXT_CHARS:] or None,
+            " ".join(chunks[i + 1:])[:CONTEXT_CHARS] or None,
+            project_id,
+            semaphore
+        ))
+        for i, chunk in enumerate(chunks)
+    ]
+
+    try:
+        first_audio = await tasks[0]
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    async def stream() -> AsyncIterator[bytes]:
+        try:
+            yield _join_chunk(first_audio, output_format, first=True)
+            for task in tasks[1:]:
+                yield _join_chunk(await task, output_format, first=False)
+        finally:
+            # Client gone or upstream failure: stop the remaining requests
+            for task in tasks:
+                task.cancel()
+
+    return stream()
@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from functions.audio import SAMPLE_RATE, split_on_silence
+
+# Constants
+LONGFORM_WORKERS = int(os.getenv("LONGFORM_WORKERS", "2"))
+LONGFORM_MIN_SECONDS = float(os.getenv("LONGFORM_MIN_SECONDS", "120"))
+LONGFORM_MIN_CHUNK_SECONDS = float(os.getenv("LONGFORM_MIN_CHUNK_SECONDS", "60"))
+LONGFORM_MAX_CHUNK_SECONDS = float(os.getenv("LONGFORM_MAX_CHUNK_SECONDS", "600"))
+LONGFORM_OVERLAP_SECONDS = float(os.getenv("LONGFORM_OVERLAP_SECONDS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(num_threads: int):
+    import torch
+    # Split the cores between worker processes instead of oversubscribing them
+    torch.set_num_threads(num_threads)
+
+
+def _transcribe_chunk(audio: np.ndarray, offset: float, model_name: str, precision: str) -> Dict[str, Any]:
+    """Runs in a worker process; each worker keeps its own model registry"""
+    from functions.transcription import get_whisper_model
+
+    model = get_whisper_model(model_name, precision=precision)
+    result = model.transcribe(audio, fp16=precision == "fp16")
+    for segment in result["segments"]:
+        segment["start"] = round(segment["start"] + offset, 3)
+        segment["end"] = round(segment["end"] + offset, 3)
+    return {"segments": result["segments"], "language": result.get("language", "en")}
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // LONGFORM_WORKERS)
+            logging.info(f"Starting {LONGFORM_WORKERS} long-form workers with {threads} threads each")
+            _pool = ProcessPoolExecutor(
+                max_workers=LONGFORM_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def stitch_chunks(chunks: List[Dict[str, Any]], bounds: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Merge per-chunk segments into one timeline. Where neighbouring chunks
+    overlap, each keeps only the segments whose midpoint falls on its side of
+    the middle of the overlap, so the shared audio is transcribed once.
+    """
+    merged = []
+    for i, chunk in enumerate(chunks):
+        lower = -float("inf")
+        upper = float("inf")
+        if i > 0:
+            lower = (bounds[i][0] + bounds[i - 1][1]) / 2 / SAMPLE_RATE
+        if i < len(chunks) - 1:
+            upper = (bounds[i + 1][0] + bounds[i][1]) / 2 / SAMPLE_RATE
+        for segment in chunk["segments"]:
+            midpoint = (segment["start"] + segment["end"]) / 2
+            if lower <= midpoint < upper:
+                merged.append(segment)
+
+    for i, segment in enumerate(merged):
+        segment["id"] = i
+    return merged
+
+
+def transcribe_long_form(
+    audio: np.ndarray,
+    model_name: str,
+    precision: str,
+    progress: Optional[Callable[[float], None]] = None
+) -> Dict[str, Any]:
+    """
+    Transcribe long audio by splitting it at silences into overlapping chunks
+    and transcribing the chunks in parallel worker processes
+
+    Args:
+        audio: float32 mono 16 kHz samples
+        model_name: Whisper model to use
+        precision: Compute precision
+        progress: Called with the completed fraction as chunks finish
+
+    Returns:
+        Dictionary shaped like the output of model.transcribe
+    """
+    duration = len(audio) / SAMPLE_RATE
+    chunk_seconds = min(
+        LONGFORM_MAX_CHUNK_SECONDS,
+        max(LONGFORM_MIN_CHUNK_SECONDS, duration / LONGFORM_WORKERS)
+    )
+    bounds = split_on_silence(audio, chunk_seconds, LONGFORM_OVERLAP_SECONDS)
+    logging.info(f"Long-form transcription of {duration:.0f}s audio in {len(bounds)} chunks")
+
+    pool = get_pool()
+    futures = [
+        pool.submit(_transcribe_chunk, audio[start:end], start / SAMPLE_RATE, model_name, precision)
+        for start, end in bounds
+    ]
+    chunks = []
+    for future in futures:
+        chunks.append(future.result())
+        if progress:
+            progress(len(chunks) / len(futures))
+
+    segments = stitch_chunks(chunks, bounds)
+    languages = Counter(chunk["language"] for chunk in chunks)
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": languages.most_common(1)[0][0] if languages else "en",
+    }
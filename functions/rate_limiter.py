@@ -0,0 +1,168 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional, Tuple
+from prometheus_client import Counter, Gauge, Histogram
+
+# Constants
+ELEVEN_CHARS_PER_MINUTE = int(os.getenv("ELEVEN_CHARS_PER_MINUTE", "0"))  # 0 disables the character budget
+ELEVEN_MAX_CONCURRENCY = int(os.getenv("ELEVEN_MAX_CONCURRENCY", "10"))
+ELEVEN_MAX_QUEUE_WAIT = float(os.getenv("ELEVEN_MAX_QUEUE_WAIT", "10"))
+DEFAULT_PROJECT = "default"
+
+GOVERNOR_WAIT = Histogram("elevenlabs_governor_wait_seconds", "Time spent waiting for upstream capacity")
+GOVERNOR_REJECTED = Counter("elevenlabs_governor_rejected_total", "Requests that gave up waiting for upstream capacity")
+GOVERNOR_THROTTLED = Counter("elevenlabs_governor_upstream_429_total", "429 responses fed back into the governor")
+GOVERNOR_ACTIVE = Gauge("elevenlabs_governor_active", "ElevenLabs requests currently holding a slot")
+
+
+class UpstreamBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("ElevenLabs capacity exhausted")
+        self.retry_after = retry_after
+
+
+class Permit:
+    """A held upstream slot; release() is idempotent"""
+
+    def __init__(self, governor: "UpstreamGovernor"):
+        self._governor = governor
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._governor._release()
+
+
+class UpstreamGovernor:
+    """
+    Keeps ElevenLabs traffic at the quota ceiling instead of bouncing off it.
+    Combines a token bucket for characters per minute, a cap on concurrent
+    requests for the API key, and a queue that serves projects round-robin
+    so one busy project cannot starve the others. Upstream 429s pause
+    dispatching for the advertised Retry-After.
+    """
+
+    def __init__(self, chars_per_minute: int, max_concurrency: int, max_wait: float):
+        self.rate = chars_per_minute / 60
+        self.capacity = float(chars_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._active = 0
+        self._queues: "OrderedDict[str, Deque[Tuple[int, asyncio.Future]]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, project: Optional[str] = None, chars: int = 0) -> Permit:
+        """
+        Wait for a slot (and, for TTS, enough character budget)
+
+        Raises:
+            UpstreamBusy: if no capacity frees up within max_wait seconds
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(project or DEFAULT_PROJECT, deque()).append((chars, future))
+        started = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not (future.done() and not future.cancelled()):
+                future.cancel()
+                GOVERNOR_REJECTED.inc()
+                raise UpstreamBusy(math.ceil(self._estimated_wait(chars)))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                future.cancel()
+            raise
+        GOVERNOR_WAIT.observe(time.monotonic() - started)
+        return Permit(self)
+
+    @asynccontextmanager
+    async def slot(self, project: Optional[str] = None, chars: int = 0):
+        permit = await self.acquire(project, chars)
+        try:
+            yield permit
+        finally:
+            permit.release()
+
+    def throttled(self, retry_after: float):
+        """Feed an upstream 429 back: stop dispatching until Retry-After has passed"""
+        GOVERNOR_THROTTLED.inc()
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logging.warning(f"ElevenLabs rate limited us, pausing dispatch for {retry_after:.1f}s")
+
+    def _release(self):
+        self._active -= 1
+        GOVERNOR_ACTIVE.set(self._active)
+        self._dispatch()
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _estimated_wait(self, chars: int = 0) -> float:
+        """Seconds until a request for chars could be served: the 429 pause or the character deficit"""
+        now = time.monotonic()
+        wait = self._paused_until - now
+        if self.rate:
+            self._refill(now)
+            # Tokens keep refilling during a pause, so the two overlap
+            queued = sum(
+                min(cost, self.capacity)
+                for waiters in self._queues.values()
+                for cost, future in waiters
+                if not future.done()
+            )
+            deficit = queued + min(chars, self.capacity) - self.tokens
+            wait = max(wait, deficit / self.rate)
+        return max(1.0, wait)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._refill(now)
+        wake_in = None
+        while self._queues and self._active < self.max_concurrency:
+            if now < self._paused_until:
+                wake_in = self._paused_until - now
+                break
+            project, waiters = next(iter(self._queues.items()))
+            chars, future = waiters[0]
+            if future.done():
+                # Timed out or cancelled while queued
+                waiters.popleft()
+                if not waiters:
+                    del self._queues[project]
+                continue
+            # A request larger than the bucket only needs a full bucket
+            cost = min(chars, self.capacity) if self.rate else 0
+            if self.tokens < cost:
+                wake_in = (cost - self.tokens) / self.rate
+                break
+            self.tokens -= cost
+            self._active += 1
+            GOVERNOR_ACTIVE.set(self._active)
+            waiters.popleft()
+            future.set_result(None)
+            # Round-robin: the project goes to the back of the line
+            del self._queues[project]
+            if waiters:
+                self._queues[project] = waiters
+
+        if wake_in is not None:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = asyncio.get_running_loop().call_later(wake_in, self._dispatch)
+
+
+upstream_governor = UpstreamGovernor(ELEVEN_CHARS_PER_MINUTE, ELEVEN_MAX_CONCURRENCY, ELEVEN_MAX_QUEUE_WAIT)
@@ -0,0 +1,150 @@
+import os
+import random
+import asyncio
+import logging
+import httpx
+from typing import Awaitable, Callable, Dict
+from circuitbreaker import CircuitBreaker, CircuitBreakerError, CircuitBreakerMonitor, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from prometheus_client import Counter
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from functions.http_client import HTTP_CONNECT_TIMEOUT, HTTP_POOL_TIMEOUT
+from functions.rate_limiter import upstream_governor
+
+# Constants
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.25"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "4"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = int(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))
+
+# Read timeouts per ElevenLabs endpoint group, in seconds
+ENDPOINT_READ_TIMEOUTS = {
+    "tts": float(os.getenv("ELEVEN_TTS_TIMEOUT", "30")),
+    "stt": float(os.getenv("ELEVEN_STT_TIMEOUT", "300")),
+    "voices": float(os.getenv("ELEVEN_VOICES_TIMEOUT", "15")),
+}
+
+UPSTREAM_FAILURES = Counter("elevenlabs_upstream_failures_total", "Failed ElevenLabs calls", ["endpoint"])
+UPSTREAM_RETRIES = Counter("elevenlabs_upstream_retries_total", "Retried ElevenLabs calls", ["endpoint"])
+BREAKER_REJECTIONS = Counter("elevenlabs_circuit_rejections_total", "Calls fast-failed by an open circuit", ["endpoint"])
+
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+def is_upstream_failure(exc_type, exc) -> bool:
+    """Failures that say something about upstream health: transport errors and 5xx"""
+    if issubclass(exc_type, httpx.TransportError):
+        return True
+    if issubclass(exc_type, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return False
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+for _endpoint in ENDPOINT_READ_TIMEOUTS:
+    breakers[_endpoint] = CircuitBreaker(
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout=BREAKER_RECOVERY_TIMEOUT,
+        expected_exception=is_upstream_failure,
+        name=f"elevenlabs_{_endpoint}",
+    )
+    CircuitBreakerMonitor.register(breakers[_endpoint])
+
+
+class CircuitStateCollector:
+    """Reports breaker state at scrape time: 0 closed, 1 half-open, 2 open"""
+
+    def collect(self):
+        gauge = GaugeMetricFamily("elevenlabs_circuit_state", "ElevenLabs circuit breaker state", labels=["endpoint"])
+        for endpoint, breaker in breakers.items():
+            gauge.add_metric([endpoint], _STATE_VALUES[breaker.state])
+        yield gauge
+
+
+REGISTRY.register(CircuitStateCollector())
+
+
+def circuit_states() -> Dict[str, str]:
+    return {endpoint: breaker.state for endpoint, breaker in breakers.items()}
+
+
+def endpoint_timeout(endpoint: str) -> httpx.Timeout:
+    read = ENDPOINT_READ_TIMEOUTS[endpoint]
+    return httpx.Timeout(read, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+
+def retry_after_seconds(response: httpx.Response, default: float = 1.0) -> float:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", default)))
+    except ValueError:
+        return default
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+# The breaker's own context manager treats every exit that is not a failure
+# as a success, which would close the circuit on a cancellation or a 4xx.
+# Outcomes are fed to it explicitly instead: failures and real successes only.
+
+def _record_failure(breaker: CircuitBreaker, exc: Exception) -> None:
+    breaker.__exit__(type(exc), exc, exc.__traceback__)
+
+
+def _record_success(breaker: CircuitBreaker) -> None:
+    breaker.__exit__(None, None, None)
+
+
+async def call_upstream(
+    endpoint: str,
+    send: Callable[[httpx.Timeout], Awaitable[httpx.Response]],
+    idempotent: bool = True
+) -> httpx.Response:
+    """
+    Call ElevenLabs with the endpoint's timeout, retries and circuit breaker
+
+    Args:
+        endpoint: Endpoint group ("tts", "stt" or "voices")
+        send: Performs the request with the given timeout and raises for error statuses
+        idempotent: Only idempotent calls are retried, with jittered exponential backoff
+
+    Raises:
+        CircuitBreakerError: if the endpoint's circuit is open
+        httpx.HTTPError: if the call still fails after the last attempt
+    """
+    breaker = breakers[endpoint]
+    attempts = UPSTREAM_RETRY_ATTEMPTS if idempotent else 1
+    attempt = 0
+    while True:
+        if breaker.opened:
+            BREAKER_REJECTIONS.labels(endpoint=endpoint).inc()
+            raise CircuitBreakerError(breaker)
+        try:
+            response = await send(endpoint_timeout(endpoint))
+        except httpx.HTTPError as e:
+            if is_upstream_failure(type(e), e):
+                _record_failure(breaker, e)
+            UPSTREAM_FAILURES.labels(endpoint=endpoint).inc()
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+                # Quota hit: slow every caller down, and retry this one if the wait is short.
+                # A rejected request had no effect, so this is safe even when not idempotent.
+                delay = retry_after_seconds(e.response)
+                upstream_governor.throttled(delay)
+                if attempt >= UPSTREAM_RETRY_ATTEMPTS - 1 or delay > UPSTREAM_RETRY_MAX_DELAY:
+                    raise
+            elif attempt >= attempts - 1 or not _retryable(e):
+                raise
+            else:
+                # Full jitter keeps retrying workers from synchronizing
+                delay = random.uniform(0, min(UPSTREAM_RETRY_MAX_DELAY, UPSTREAM_RETRY_BASE_DELAY * 2 ** attempt))
+            logging.warning(f"ElevenLabs {endpoint} call failed ({e}), retrying in {delay:.2f}s")
+            UPSTREAM_RETRIES.labels(endpoint=endpoint).inc()
+            attempt += 1
+            await asyncio.sleep(delay)
+        else:
+            if response.is_success:
+                _record_success(breaker)
+            return response
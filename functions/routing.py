@@ -0,0 +1,104 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import List, Tuple
+from circuitbreaker import STATE_OPEN
+from prometheus_client import Counter
+from functions.audio import AudioSource, estimate_duration
+from functions.inference_executor import inference_executor
+from functions.resilience import breakers
+from functions.timing import recent_rtf
+
+# Constants
+TRANSCRIBE_ROUTING = os.getenv("TRANSCRIBE_ROUTING", "0") == "1"
+ROUTING_TARGET_SECONDS = float(os.getenv("ROUTING_TARGET_SECONDS", "30"))
+ROUTING_SMALL_WHISPER_MODEL = os.getenv("ROUTING_SMALL_WHISPER_MODEL", "base")
+ROUTING_ASSUMED_KBPS = float(os.getenv("ROUTING_ASSUMED_KBPS", "128"))  # for sizing compressed uploads
+# Real-time factors assumed until an engine/model has run on this node
+ROUTING_WHISPER_PRIOR_RTF = float(os.getenv("ROUTING_WHISPER_PRIOR_RTF", "0.5"))
+ROUTING_ELEVENLABS_PRIOR_RTF = float(os.getenv("ROUTING_ELEVENLABS_PRIOR_RTF", "0.2"))
+
+ROUTING_DECISIONS = Counter(
+    "transcription_routing_decisions_total",
+    "Engines chosen by the routing policy",
+    ["engine", "model", "reason"],
+)
+
+
+@dataclass
+class Route:
+    engine: str  # "whisper" or "elevenlabs"
+    model: str
+    estimated_seconds: float
+    reason: str
+
+
+def _rtf(engine: str, model: str) -> float:
+    rtf = recent_rtf(engine, model)
+    if rtf is not None:
+        return rtf
+    return ROUTING_WHISPER_PRIOR_RTF if engine == "whisper" else ROUTING_ELEVENLABS_PRIOR_RTF
+
+
+def _whisper_estimate(model: str, duration: float) -> float:
+    """Queue wait plus run time on the local pool"""
+    run_seconds = duration * _rtf("whisper", model)
+    busy = inference_executor.running + inference_executor.queue_depth
+    if busy < inference_executor.workers:
+        return run_seconds
+    # Assume the jobs ahead of us are about as long as this one
+    waves = (busy - inference_executor.workers) // inference_executor.workers + 1
+    return waves * run_seconds + run_seconds
+
+
+def choose_route(
+    content: AudioSource,
+    whisper_model: str,
+    eleven_model: str,
+    target_seconds: float = ROUTING_TARGET_SECONDS
+) -> Route:
+    """
+    Pick the engine expected to finish within target_seconds, preferring the
+    requested Whisper model, then ROUTING_SMALL_WHISPER_MODEL, then
+    ElevenLabs. Estimates come from the upload's duration, the local queue
+    and the recent real-time factor of each engine; if nothing meets the
+    target, the fastest estimate wins.
+    """
+    duration = estimate_duration(content, ROUTING_ASSUMED_KBPS)
+    queue_full = inference_executor.running + inference_executor.queue_depth >= (
+        inference_executor.workers + inference_executor.max_queue_depth
+    )
+    eleven_available = breakers["stt"].state != STATE_OPEN
+
+    candidates: List[Tuple[str, str, float]] = []
+    if not queue_full:
+        candidates.append(("whisper", whisper_model, _whisper_estimate(whisper_model, duration)))
+        if ROUTING_SMALL_WHISPER_MODEL and ROUTING_SMALL_WHISPER_MODEL != whisper_model:
+            candidates.append(
+                ("whisper", ROUTING_SMALL_WHISPER_MODEL, _whisper_estimate(ROUTING_SMALL_WHISPER_MODEL, duration))
+            )
+    if eleven_available:
+        candidates.append(("elevenlabs", eleven_model, duration * _rtf("elevenlabs", eleven_model)))
+
+    if not candidates:
+        # Nowhere to send it; let the Whisper path report the full queue
+        route = Route("whisper", whisper_model, float("inf"), "unavailable")
+    else:
+        within = [candidate for candidate in candidates if candidate[2] <= target_seconds]
+        if within:
+            engine, model, estimate = within[0]
+            reason = "preferred" if (engine, model) == candidates[0][:2] else "target"
+        else:
+            engine, model, estimate = min(candidates, key=lambda candidate: candidate[2])
+            reason = "fastest"
+        if queue_full and engine == "elevenlabs":
+            reason = "queue_full"
+        route = Route(engine, model, estimate, reason)
+
+    ROUTING_DECISIONS.labels(engine=route.engine, model=route.model, reason=route.reason).inc()
+    if route.reason != "preferred":
+        logging.info(
+            f"Routing {duration:.0f}s of audio to {route.engine}/{route.model} "
+            f"(estimated {route.estimated_seconds:.1f}s, {route.reason})"
+        )
+    return route
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+from typing import AsyncIterator
+from prometheus_client import Counter
+
+# Constants
+STREAM_MIN_CHUNK = int(os.getenv("STREAM_MIN_CHUNK", "4096"))
+STREAM_MAX_CHUNK = int(os.getenv("STREAM_MAX_CHUNK", "65536"))
+STREAM_MAX_DELAY_MS = int(os.getenv("STREAM_MAX_DELAY_MS", "50"))
+STREAM_BUFFER_CHUNKS = int(os.getenv("STREAM_BUFFER_CHUNKS", "32"))
+
+STREAMS_CANCELLED = Counter("audio_streams_cancelled_total", "Audio streams abandoned by the client before completion")
+STREAM_UPSTREAM_FAILURES = Counter("audio_stream_upstream_failures_total", "Audio streams cut short by an upstream error")
+
+_END = object()
+
+
+async def relay_stream(
+    source: AsyncIterator[bytes],
+    min_chunk: int = STREAM_MIN_CHUNK,
+    max_chunk: int = STREAM_MAX_CHUNK,
+    max_delay_ms: int = STREAM_MAX_DELAY_MS
+) -> AsyncIterator[bytes]:
+    """
+    Relay an upstream byte stream to the client without a threadpool
+
+    The first bytes are sent as soon as they arrive. After that, chunks are
+    coalesced to a target size that doubles up to max_chunk, but never held
+    longer than max_delay_ms. A bounded queue between the upstream reader and
+    the client gives backpressure: a slow client stops the reader, which stops
+    draining the upstream socket. When the client disconnects, the response is
+    cancelled and the upstream request is closed so it stops billing.
+
+    Args:
+        source: Upstream async byte iterator
+        min_chunk: Initial coalescing target in bytes
+        max_chunk: Largest chunk sent to the client
+        max_delay_ms: Longest time buffered bytes wait for more data
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+
+    async def pump():
+        try:
+            async for chunk in source:
+                if chunk:
+                    await queue.put(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await queue.put(_END)
+            raise
+        await queue.put(_END)
+
+    reader = asyncio.create_task(pump())
+    target = min_chunk
+    buffer = bytearray()
+    first = True
+    try:
+        while True:
+            timeout = max_delay_ms / 1000 if buffer else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _END:
+                if buffer:
+                    yield bytes(buffer)
+                break
+            if item is not None:
+                buffer += item
+
+            if buffer and (first or item is None or len(buffer) >= target):
+                while len(buffer) > max_chunk:
+                    yield bytes(buffer[:max_chunk])
+                    del buffer[:max_chunk]
+                yield bytes(buffer)
+                buffer.clear()
+                first = False
+                target = min(target * 2, max_chunk)
+
+        # Re-raise upstream errors that ended the pump
+        await reader
+    except (asyncio.CancelledError, GeneratorExit):
+        # The response was cancelled or closed: the client went away
+        STREAMS_CANCELLED.inc()
+        logging.info("Client left before the audio stream finished, cancelling upstream")
+        raise
+    except Exception:
+        STREAM_UPSTREAM_FAILURES.inc()
+        raise
+    finally:
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except (asyncio.CancelledError, Exception):
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from functions.audio import SAMPLE_RATE
+from functions.transcription import default_precision, get_whisper_model, model_lock
+
+# Constants
+STREAM_STT_MIN_CHUNK_SECONDS = float(os.getenv("STREAM_STT_MIN_CHUNK_SECONDS", "0.5"))
+STREAM_STT_BUFFER_SECONDS = float(os.getenv("STREAM_STT_BUFFER_SECONDS", "15"))
+# Hard cap: past this, the hypothesis is committed without agreement, or the audio dropped
+STREAM_STT_MAX_BUFFER_SECONDS = float(os.getenv("STREAM_STT_MAX_BUFFER_SECONDS", "30"))
+PROMPT_CHARS = 200  # committed text fed back as the initial prompt
+
+Word = Tuple[float, float, str]  # (start, end, text) in seconds from the start of the stream
+
+_NORMALIZE_RE = re.compile(r"[^\w']+")
+
+
+def _normalize(word: str) -> str:
+    return _NORMALIZE_RE.sub("", word.lower())
+
+
+def _as_dicts(words: List[Word]) -> List[Dict[str, Any]]:
+    return [{"text": text.strip(), "start": round(start, 3), "end": round(end, 3)} for start, end, text in words]
+
+
+class StreamingTranscriber:
+    """
+    Incremental Whisper transcription with the LocalAgreement-2 policy: the
+    growing audio buffer is re-transcribed on every step, and a word is
+    committed once two consecutive hypotheses agree on it. Committed words
+    never change; the rest of the latest hypothesis is reported as partial.
+    The buffer is trimmed at the last committed word so each step stays cheap,
+    and never exceeds STREAM_STT_MAX_BUFFER_SECONDS even when nothing agrees.
+    """
+
+    def __init__(self, model_name: str, precision: Optional[str] = None, language: Optional[str] = None):
+        self.model_name = model_name
+        self.precision = precision  # resolved on the inference thread, where torch is imported
+        self.language = language
+        self._incoming: List[np.ndarray] = []
+        self._incoming_lock = threading.Lock()
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._offset = 0.0  # stream time of the first sample in the buffer
+        self._committed: List[Word] = []
+        self._hypothesis: List[Word] = []  # uncommitted tail of the previous hypothesis
+
+    def insert_audio(self, audio: np.ndarray):
+        """Queue samples; safe to call while process() runs on another thread"""
+        with self._incoming_lock:
+            self._incoming.append(audio)
+
+    @property
+    def pending_seconds(self) -> float:
+        with self._incoming_lock:
+            return sum(len(chunk) for chunk in self._incoming) / SAMPLE_RATE
+
+    def _take_incoming(self):
+        with self._incoming_lock:
+            incoming, self._incoming = self._incoming, []
+        if incoming:
+            self._buffer = np.concatenate([self._buffer, *incoming])
+
+    def _prompt(self) -> str:
+        # Words already trimmed out of the buffer give the decoder context
+        text = "".join(word for start, end, word in self._committed if end <= self._offset)
+        return text[-PROMPT_CHARS:]
+
+    def _transcribe_buffer(self) -> List[Word]:
+        self.precision = self.precision or default_precision()
+        model = get_whisper_model(self.model_name, precision=self.precision)
+        with model_lock(model):
+            result = model.transcribe(
+                self._buffer,
+                language=self.language,
+                initial_prompt=self._prompt() or None,
+                word_timestamps=True,
+                condition_on_previous_text=False,
+                fp16=self.precision == "fp16",
+            )
+        if not self.language and result.get("language"):
+            # Detecting once keeps later steps from flip-flopping
+            self.language = result["language"]
+        words = []
+        for segment in result["segments"]:
+            for word in segment.get("words", []):
+                words.append((word["start"] + self._offset, word["end"] + self._offset, word["word"]))
+        return words
+
+    def _drop_committed(self, words: List[Word]) -> List[Word]:
+        """Remove words the new hypothesis repeats from the committed tail"""
+        committed_end = self._committed[-1][1] if self._committed else 0.0
+        words = [word for word in words if word[0] > committed_end - 0.1]
+        if not words or not self._committed or abs(words[0][0] - committed_end) > 1.0:
+            return words
+        for n in range(min(5, len(words), len(self._committed)), 0, -1):
+            tail = [_normalize(word[2]) for word in self._committed[-n:]]
+            head = [_normalize(word[2]) for word in words[:n]]
+            if tail == head:
+                return words[n:]
+        return words
+
+    def _cut(self, samples: int):
+        self._buffer = self._buffer[samples:]
+        self._offset += samples / SAMPLE_RATE
+
+    def _trim(self) -> List[Word]:
+        """Bound the buffer; returns words committed without agreement to do so"""
+        forced: List[Word] = []
+        if len(self._buffer) / SAMPLE_RATE > STREAM_STT_MAX_BUFFER_SECONDS and self._hypothesis:
+            # The hypotheses have not converged for too long; take the latest one
+            forced, self._hypothesis = self._hypothesis, []
+            self._committed.extend(forced)
+
+        if len(self._buffer) / SAMPLE_RATE > STREAM_STT_BUFFER_SECONDS and self._committed:
+            cut = int((self._committed[-1][1] - self._offset) * SAMPLE_RATE)
+            if cut > 0:
+                self._cut(cut)
+
+        if len(self._buffer) / SAMPLE_RATE > STREAM_STT_MAX_BUFFER_SECONDS:
+            # Silence or no usable words: drop the oldest audio
+            self._cut(len(self._buffer) - int(STREAM_STT_BUFFER_SECONDS * SAMPLE_RATE))
+            self._hypothesis = [word for word in self._hypothesis if word[0] >= self._offset]
+        return forced
+
+    def process(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Transcribe the buffer with the newly arrived audio. Blocking; run it on
+        the inference executor.
+
+        Returns:
+            (newly committed words, current partial words)
+        """
+        self._take_incoming()
+        if not len(self._buffer):
+            return [], []
+
+        words = self._drop_committed(self._transcribe_buffer())
+        agreed = []
+        for previous, current in zip(self._hypothesis, words):
+            if _normalize(previous[2]) != _normalize(current[2]):
+                break
+            agreed.append(current)
+        self._committed.extend(agreed)
+        self._hypothesis = words[len(agreed):]
+        agreed.extend(self._trim())
+        return _as_dicts(agreed), _as_dicts(self._hypothesis)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Transcribe what is left and commit the whole final hypothesis"""
+        self._take_incoming()
+        words = self._drop_committed(self._transcribe_buffer()) if len(self._buffer) else self._hypothesis
+        self._committed.extend(words)
+        self._hypothesis = []
+        return _as_dicts(words)
+
+    @property
+    def text(self) -> str:
+        return "".join(word for start, end, word in self._committed).strip()
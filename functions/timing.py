@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from prometheus_client import Histogram
+
+# Constants
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0") == "1"
+RTF_EWMA_ALPHA = float(os.getenv("RTF_EWMA_ALPHA", "0.2"))  # weight of the newest observation
+
+STAGE_SECONDS = Histogram(
+    "transcription_stage_seconds",
+    "Time spent in each transcription pipeline stage",
+    ["stage", "engine", "model"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+REAL_TIME_FACTOR = Histogram(
+    "transcription_real_time_factor",
+    "Processing time divided by audio duration",
+    ["engine", "model"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5),
+)
+
+# Stage durations of the current request, in milliseconds. The dict is shared
+# by reference with inference threads (contextvars are copied into them), so
+# stages timed there show up in the request's Server-Timing header too.
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def start_request_timing():
+    return _request_timings.set({})
+
+
+def end_request_timing(token) -> Dict[str, float]:
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
+def record_stage(name: str, seconds: float, engine: str = "", model: str = ""):
+    STAGE_SECONDS.labels(stage=name, engine=engine, model=model).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        # Stages that run once per file add up over a multi-file request
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+
+@contextmanager
+def stage(name: str, engine: str = "", model: str = ""):
+    """Time a pipeline stage into the histogram and the request's Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started, engine, model)
+
+
+# Recent real-time factor per (engine, model), smoothed, for routing decisions
+_rtf_ewma: Dict[Tuple[str, str], float] = {}
+_rtf_lock = threading.Lock()
+
+
+def observe_rtf(engine: str, model: str, processing_seconds: float, audio_seconds: float):
+    if audio_seconds > 0:
+        rtf = processing_seconds / audio_seconds
+        REAL_TIME_FACTOR.labels(engine=engine, model=model).observe(rtf)
+        with _rtf_lock:
+            previous = _rtf_ewma.get((engine, model))
+            _rtf_ewma[(engine, model)] = rtf if previous is None else previous + RTF_EWMA_ALPHA * (rtf - previous)
+
+
+def recent_rtf(engine: str, model: str) -> Optional[float]:
+    """Smoothed real-time factor of recent runs, or None before the first one"""
+    with _rtf_lock:
+        return _rtf_ewma.get((engine, model))
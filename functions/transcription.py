@@ -1,53 +1,350 @@
 import os
-import requests
+import time
+import asyncio
 import logging
-import tempfile
+import weakref
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from dotenv import load_dotenv
-from typing import Dict, Any, List, Union
+from typing import BinaryIO, Callable, Dict, Any, List, Optional, Tuple, Union
 from fastapi import HTTPException
-import whisper
-import torch
+from prometheus_client import Counter, Gauge
+import numpy as np
+from functions.audio import SAMPLE_RATE, AudioSource, decode_audio, detect_speech
+from functions.longform import LONGFORM_MIN_SECONDS, transcribe_long_form
+from functions.inference_executor import inference_executor, InferenceQueueFull
+from functions.timing import observe_rtf, stage
+from functions.routing import TRANSCRIBE_ROUTING, choose_route
+from functions.eleven_api import transcribe_audio
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
 # Constants
-ELEVEN_API_BASE_URL = "https://api.elevenlabs.io/v1"
-ELEVEN_STT_URL = f"{ELEVEN_API_BASE_URL}/speech-to-text"
-ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
+DEFAULT_WHISPER_MODEL = "turbo"
+# Precision on CPU-only nodes: "fp32", or "int8" for dynamically quantized Linear layers
+WHISPER_CPU_PRECISION = os.getenv("WHISPER_CPU_PRECISION", "fp32")
+# torch thread pools; 0 keeps torch's defaults
+WHISPER_NUM_THREADS = int(os.getenv("WHISPER_NUM_THREADS", "0"))
+WHISPER_INTEROP_THREADS = int(os.getenv("WHISPER_INTEROP_THREADS", "0"))
+# Batch concurrent requests through the encoder/decoder (see functions/batching.py)
+WHISPER_BATCHING = os.getenv("WHISPER_BATCHING", "0") == "1"
+# RAM (or VRAM) budget shared by all loaded Whisper models
+WHISPER_MODEL_CACHE_MB = int(os.getenv("WHISPER_MODEL_CACHE_MB", "8192"))
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-logging.info(f"Using device: {DEVICE} for Whisper model")
+# Models loaded and warmed at startup, before the instance reports ready
+WHISPER_PRELOAD_MODELS = [
+    name.strip() for name in os.getenv("WHISPER_PRELOAD_MODELS", DEFAULT_WHISPER_MODEL).split(",") if name.strip()
+]
 
-# Load Whisper model once at module level for efficiency
-DEFAULT_WHISPER_MODEL = "turbo"
-whisper_model = None
+# Skip silence before inference; can be overridden per request
+WHISPER_VAD = os.getenv("WHISPER_VAD", "0") == "1"
+VAD_GAP_SECONDS = 0.3  # silence kept between joined speech regions so words do not run together
+VAD_MAX_SPEECH_RATIO = 0.9  # above this, compacting saves too little to be worth it
+
+# Latency-SLO mode: race ElevenLabs against a slow or queued Whisper run
+TRANSCRIBE_HEDGE = os.getenv("TRANSCRIBE_HEDGE", "0") == "1"
+HEDGE_BUDGET_SECONDS = float(os.getenv("HEDGE_BUDGET_SECONDS", "10"))
+HEDGE_QUEUE_DEPTH = int(os.getenv("HEDGE_QUEUE_DEPTH", "4"))  # hedge at once when this many jobs wait
+
+# Partial mode: how often a file waits out a full inference queue before giving up
+PARTIAL_QUEUE_RETRIES = int(os.getenv("PARTIAL_QUEUE_RETRIES", "3"))
+
+HEDGE_ELIGIBLE = Counter("transcription_hedge_eligible_total", "Files transcribed in hedged mode")
+HEDGES_FIRED = Counter("transcription_hedges_total", "Hedged ElevenLabs requests started while Whisper was still running")
+HEDGE_WINS = Counter("transcription_hedge_wins_total", "Hedged races won, by engine", ["engine"])
+
+MODEL_CACHE_HITS = Counter("whisper_model_cache_hits_total", "Whisper model registry hits")
+MODEL_CACHE_MISSES = Counter("whisper_model_cache_misses_total", "Whisper model registry misses (model loads)")
+MODEL_CACHE_EVICTIONS = Counter("whisper_model_cache_evictions_total", "Whisper models evicted from the registry")
+MODEL_CACHE_BYTES = Gauge("whisper_model_cache_bytes", "Estimated memory held by loaded Whisper models")
+
+ModelKey = Tuple[str, str, str]
+
+
+# torch and whisper take seconds and hundreds of MB to import, so they are
+# only imported on first use, from the inference threads
+@lru_cache(maxsize=None)
+def get_device() -> str:
+    import torch
+    # Interop threads can only be set once, before any parallel work has run
+    if WHISPER_NUM_THREADS:
+        torch.set_num_threads(WHISPER_NUM_THREADS)
+    if WHISPER_INTEROP_THREADS:
+        torch.set_num_interop_threads(WHISPER_INTEROP_THREADS)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    logging.info(f"Using device: {device} for Whisper model")
+    return device
+
+
+def default_precision() -> str:
+    return "fp16" if get_device() == "cuda" else WHISPER_CPU_PRECISION
+
+
+def _model_nbytes(model) -> int:
+    """Estimate the memory footprint of a loaded model from its state dict"""
+    total = 0
+    for value in model.state_dict().values():
+        # Quantized Linear layers store their weight and bias as a packed tuple
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if hasattr(tensor, "numel"):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _quantize_int8(model):
+    """
+    Dynamically quantize every Linear layer to int8 weights (activations are
+    quantized on the fly). Whisper uses its own Linear subclass, which
+    quantize_dynamic does not match, so those are turned back into plain
+    nn.Linear first; they only differ in casting weights to the input dtype.
+    """
+    import torch
+    from whisper.model import Linear as WhisperLinear
+
+    for module in model.modules():
+        if type(module) is WhisperLinear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _checkpoint_nbytes(model_name: str) -> int:
+    """Size of an already downloaded checkpoint, used to make room before loading it"""
+    import whisper
+    url = getattr(whisper, "_MODELS", {}).get(model_name)
+    if url is None:
+        return 0
+    default_root = os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(os.getenv("XDG_CACHE_HOME", default_root), "whisper", os.path.basename(url))
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class WhisperModelRegistry:
+    """
+    Holds several loaded Whisper models at once and evicts the least recently
+    used one when the estimated memory of all models exceeds the budget.
+    Models are keyed by (model name, device, precision).
+    """
 
-def get_whisper_model(model_name: str = DEFAULT_WHISPER_MODEL):
-    global whisper_model
-    if whisper_model is None:
-        logging.info(f"Loading Whisper model: {model_name} on {DEVICE}")
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[ModelKey, Any]" = OrderedDict()
+        self._sizes: Dict[ModelKey, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_name: str, device: Optional[str] = None, precision: Optional[str] = None):
+        precision = precision or default_precision()
+        if precision == "int8":
+            # Dynamic quantization only has CPU kernels
+            device = "cpu"
+        key = (model_name, device or get_device(), precision)
+        with self._lock:
+            model = self._lookup(key)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given key; the others wait and then hit the cache
+        with load_lock:
+            with self._lock:
+                model = self._lookup(key)
+                if model is not None:
+                    return model
+                self.misses += 1
+                MODEL_CACHE_MISSES.inc()
+                self._evict_until_fits(_checkpoint_nbytes(model_name))
+
+            model = self._load(*key)
+            size = _model_nbytes(model)
+
+            with self._lock:
+                self._models[key] = model
+                self._sizes[key] = size
+                self._evict_until_fits(0, keep=key)
+                MODEL_CACHE_BYTES.set(sum(self._sizes.values()))
+            return model
+
+    def _lookup(self, key: ModelKey):
+        model = self._models.get(key)
+        if model is not None:
+            self._models.move_to_end(key)
+            self.hits += 1
+            MODEL_CACHE_HITS.inc()
+        return model
+
+    def _load(self, model_name: str, device: str, precision: str):
+        logging.info(f"Loading Whisper model: {model_name} on {device} ({precision})")
+        import whisper
         try:
-            whisper_model = whisper.load_model(model_name, device=DEVICE)
-            logging.info(f"Model device: {next(whisper_model.parameters()).device}")
+            model = whisper.load_model(model_name, device=device)
+            if precision == "int8":
+                model = _quantize_int8(model)
+            logging.info(f"Model device: {next(model.parameters()).device}")
+            return model
         except Exception as e:
-            logging.error(f"Failed to load model on {DEVICE}: {e}")
+            logging.error(f"Failed to load model on {device}: {e}")
             raise
-    return whisper_model
+
+    def _evict_until_fits(self, incoming: int, keep: Optional[ModelKey] = None):
+        """Evict least recently used models until `incoming` more bytes fit the budget"""
+        evicted = False
+        while self._models and sum(self._sizes.values()) + incoming > self.max_bytes:
+            key = next(iter(self._models))
+            if key == keep:
+                # A single model larger than the budget is still served
+                break
+            self._models.pop(key)
+            size = self._sizes.pop(key)
+            self.evictions += 1
+            evicted = True
+            MODEL_CACHE_EVICTIONS.inc()
+            logging.info(f"Evicted Whisper model {key} ({size / 2**20:.0f} MB)")
+        MODEL_CACHE_BYTES.set(sum(self._sizes.values()))
+        if evicted and get_device() == "cuda":
+            import torch
+            torch.cuda.empty_cache()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "models": [list(key) for key in self._models],
+                "bytes": sum(self._sizes.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+model_registry = WhisperModelRegistry(WHISPER_MODEL_CACHE_MB * 2**20)
+
+# Whisper's decoder installs its kv-cache as forward hooks on modules shared by
+# every caller, so two decodes on one model instance read each other's cache.
+# Each loaded model therefore runs one inference at a time.
+_inference_locks: "weakref.WeakKeyDictionary[Any, threading.Lock]" = weakref.WeakKeyDictionary()
+_inference_locks_guard = threading.Lock()
+
+
+def model_lock(model) -> threading.Lock:
+    """The lock to hold around any transcribe/decode call on this model instance"""
+    with _inference_locks_guard:
+        lock = _inference_locks.get(model)
+        if lock is None:
+            lock = _inference_locks[model] = threading.Lock()
+        return lock
+
+
+def get_whisper_model(
+    model_name: str = DEFAULT_WHISPER_MODEL,
+    device: Optional[str] = None,
+    precision: Optional[str] = None
+):
+    return model_registry.get(model_name, device, precision)
+
+_models_ready = threading.Event()
+
+
+def models_ready() -> bool:
+    return _models_ready.is_set()
+
+
+def preload_models(model_names: List[str] = WHISPER_PRELOAD_MODELS):
+    """
+    Load the given models and run one second of silence through each, so the
+    first real request does not pay for weight loading, kernel selection or
+    allocator warm-up. Blocking; marks the service ready when done.
+    """
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    for model_name in model_names:
+        try:
+            started = time.monotonic()
+            model = get_whisper_model(model_name)
+            with model_lock(model):
+                model.transcribe(silence, fp16=default_precision() == "fp16")
+            logging.info(f"Whisper model {model_name} warmed up in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            # Requests can still fall back to ElevenLabs, so do not keep the instance out of rotation
+            logging.error(f"Failed to preload Whisper model {model_name}: {e}")
+    _models_ready.set()
+
+
+TimeMap = List[Tuple[float, float, float]]  # (compact start, original start, duration) in seconds
+
+
+def compact_speech(audio: np.ndarray, regions: List[Tuple[int, int]]) -> Tuple[np.ndarray, TimeMap]:
+    """Join speech regions with short gaps and record where each one came from"""
+    gap = np.zeros(int(VAD_GAP_SECONDS * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    time_map = []
+    position = 0
+    for start, end in regions:
+        time_map.append((position / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE))
+        parts.extend([audio[start:end], gap])
+        position += end - start + len(gap)
+    return np.concatenate(parts[:-1]), time_map
+
+
+def _original_time(t: float, time_map: TimeMap) -> float:
+    for compact_start, original_start, duration in reversed(time_map):
+        if t >= compact_start:
+            # Times inside a joining gap land at the end of the region before it
+            return round(original_start + min(t - compact_start, duration), 3)
+    return round(time_map[0][1], 3)
+
+
+def restore_timeline(segments: List[Dict[str, Any]], time_map: TimeMap):
+    """Map segment (and word) timestamps from the compacted audio back to the upload"""
+    for segment in segments:
+        segment["start"] = _original_time(segment["start"], time_map)
+        segment["end"] = _original_time(segment["end"], time_map)
+        for word in segment.get("words") or []:
+            word["start"] = _original_time(word["start"], time_map)
+            word["end"] = _original_time(word["end"], time_map)
+
+
+def _empty_result(model_name: str, speech_ratio: float) -> Dict[str, Any]:
+    return {
+        "text": "",
+        "language_code": "en",
+        "language_probability": 0.0,
+        "words": [],
+        "segments": [],
+        "confidence": 1.0,
+        "engine": "whisper",
+        "model": model_name,
+        "speech_ratio": speech_ratio
+    }
+
 
 def transcribe_with_whisper(
-    audio_contents: Union[bytes, List[bytes]], 
+    audio_contents: Union[AudioSource, List[AudioSource]], 
     filenames: Union[str, List[str]], 
-    model_name: str = DEFAULT_WHISPER_MODEL
+    model_name: str = DEFAULT_WHISPER_MODEL,
+    precision: Optional[str] = None,
+    long_form: bool = False,
+    progress: Optional[Callable[[float], None]] = None,
+    vad: Optional[bool] = None,
+    partial: bool = False
 ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
     """
     Transcribe audio using the Whisper model
     
     Args:
-        audio_contents: Binary content of one or more audio files
+        audio_contents: Binary content of, or seekable file handles to, one or more audio files
         filenames: Names of the audio files
         model_name: Whisper model to use
+        precision: Compute precision, defaults to fp16 on CUDA and fp32 on CPU
+        long_form: Split long audio into chunks transcribed in parallel processes
+        progress: Called from the worker thread with the completed fraction (0-1)
+        vad: Transcribe only detected speech regions (defaults to WHISPER_VAD)
+        partial: Record a failed file as an error entry and carry on with the rest,
+            instead of raising and losing the files already transcribed
         
     Returns:
         Dictionary or list of dictionaries with transcription results
@@ -57,23 +354,58 @@ def transcribe_with_whisper(
         audio_contents = [audio_contents]
         filenames = [filenames]
     
-    model = get_whisper_model(model_name)
+    precision = precision or default_precision()
+    vad = WHISPER_VAD if vad is None else vad
     results = []
     
-    for content, filename in zip(audio_contents, filenames):
+    for index, (content, filename) in enumerate(zip(audio_contents, filenames)):
         try:
-            # Save the audio content to a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{filename.split('.')[-1]}") as temp_file:
-                temp_file.write(content)
-                temp_path = temp_file.name
+            started = time.perf_counter()
+            # Decode in memory instead of round-tripping through a temp file
+            with stage("audio_decode", "whisper", model_name):
+                audio = decode_audio(content, filename)
+            duration = len(audio) / SAMPLE_RATE
+
+            # Drop the silence so the model only sees speech
+            time_map = None
+            speech_ratio = None
+            if vad and len(audio):
+                with stage("vad", "whisper", model_name):
+                    regions = detect_speech(audio)
+                speech_ratio = round(sum(end - start for start, end in regions) / len(audio), 3)
+                logging.info(f"VAD kept {speech_ratio:.0%} of {filename}")
+                if not regions:
+                    results.append(_empty_result(model_name, speech_ratio))
+                    if progress:
+                        progress((index + 1) / len(audio_contents))
+                    continue
+                if speech_ratio <= VAD_MAX_SPEECH_RATIO:
+                    audio, time_map = compact_speech(audio, regions)
             
             # Transcribe using Whisper
-            logging.info(f"Transcribing {filename} with Whisper on {DEVICE}")
-            result = model.transcribe(temp_path)
-            
-            # Clean up temp file
-            os.unlink(temp_path)
+            logging.info(f"Transcribing {filename} with Whisper on {get_device()}")
+            if long_form and len(audio) > LONGFORM_MIN_SECONDS * SAMPLE_RATE:
+                file_progress = None
+                if progress:
+                    file_progress = lambda done, i=index: progress((i + done) / len(audio_contents))
+                with stage("inference", "whisper", model_name):
+                    result = transcribe_long_form(audio, model_name, precision, file_progress)
+            elif WHISPER_BATCHING:
+                from functions.batching import transcribe_batched
+                with stage("model_load", "whisper", model_name):
+                    model = get_whisper_model(model_name, precision=precision)
+                # Share encoder/decoder passes with concurrent requests
+                with stage("inference", "whisper", model_name):
+                    result = transcribe_batched(model, model_name, audio, precision)
+            else:
+                with stage("model_load", "whisper", model_name):
+                    model = get_whisper_model(model_name, precision=precision)
+                with stage("inference", "whisper", model_name), model_lock(model):
+                    result = model.transcribe(audio, fp16=precision == "fp16")
             
+            if time_map:
+                restore_timeline(result["segments"], time_map)
+
             # Extract the detected language
             language_code = result.get("language", "en")
             
@@ -89,6 +421,9 @@ def transcribe_with_whisper(
                 "model": model_name
             }
             
+            if speech_ratio is not None:
+                transcription_result["speech_ratio"] = speech_ratio
+            
             # Convert segments to words for compatibility with the expected schema
             for segment in result["segments"]:
                 transcription_result["words"].append({
@@ -99,79 +434,289 @@ def transcribe_with_whisper(
                     "speaker_id": "0"  # Default speaker ID
                 })
             
+            observe_rtf("whisper", model_name, time.perf_counter() - started, duration)
             results.append(transcription_result)
+            if progress:
+                progress((index + 1) / len(audio_contents))
             
         except Exception as e:
             logging.error(f"Error transcribing with Whisper: {e}")
+            if partial:
+                results.append(_error_entry(filename, f"Whisper: {e}"))
+                continue
             raise HTTPException(status_code=500, detail=f"Failed to transcribe audio with Whisper: {str(e)}")
+
+    if partial:
+        for result, filename in zip(results, filenames):
+            result.setdefault("status", "ok")
+            result.setdefault("filename", filename)
     
     # Return a single result if only one file was processed
     return results[0] if len(results) == 1 else results
 
-# Eleven Labs API variant
-def transcribe_audio(audio_content: bytes, filename: str, model_id: str = "scribe_v1") -> Dict[str, Any]:
+def _error_message(e: Exception) -> str:
+    return str(e.detail) if isinstance(e, HTTPException) else str(e)
+
+
+def _error_entry(filename: str, error: str, status_code: int = 500) -> Dict[str, Any]:
+    return {
+        "status": "error", "status_code": status_code, "filename": filename,
+        "error": error, "engine": None, "model": None
+    }
+
+
+async def _transcribe_with_elevenlabs(
+    content: AudioSource,
+    filename: str,
+    eleven_model: str,
+    project_id: Optional[str]
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with stage("fallback", "elevenlabs", eleven_model):
+        result = await transcribe_audio(content, filename, eleven_model, project_id=project_id)
+    # The upload was not decoded locally; the last word's end approximates its duration
+    words = result.get("words") or []
+    if words:
+        observe_rtf("elevenlabs", eleven_model, time.perf_counter() - started, words[-1].get("end", 0))
+    result["engine"] = "elevenlabs"  # Add engine information
+    result["model"] = eleven_model
+    return result
+
+
+async def _transcribe_partial(
+    audio_contents: List[AudioSource],
+    filenames: List[str],
+    whisper_model: str,
+    eleven_model: str,
+    long_form: bool,
+    project_id: Optional[str],
+    progress: Optional[Callable[[float], None]],
+    vad: Optional[bool]
+) -> List[Dict[str, Any]]:
     """
-    Transcribe audio to text using ElevenLabs Speech-to-Text API
-    
-    Args:
-        audio_content: Binary content of the audio file
-        filename: Name of the audio file
-        model_id: Model ID to use for transcription (default: scribe_v1)
-        
-    Returns:
-        Dictionary with transcription result
+    Result-accumulating transcription: the files go through Whisper
+    concurrently, the ones that fail are retried on ElevenLabs concurrently,
+    and each file ends up with its own entry, so one bad file never discards
+    the others. At most `workers` files are submitted to the inference
+    executor at a time. A full queue is waited out rather than sent to the
+    paid engine; a file that still finds it full gets a 503 error entry.
     """
-    headers = {
-        "xi-api-key": ELEVEN_API_KEY
-    }
-    
-    files = {
-        "file": (filename, audio_content, "audio/mpeg")
-    }
-    
-    data = {
-        "model_id": model_id
-    }
-    
+    total = len(audio_contents)
+    finished = 0
+    submissions = asyncio.Semaphore(max(1, inference_executor.workers))
+
+    def file_done():
+        nonlocal finished
+        finished += 1
+        if progress:
+            progress(finished / total)
+
+    async def whisper(content: AudioSource, filename: str):
+        attempt = 0
+        while True:
+            try:
+                async with submissions:
+                    result = await inference_executor.run(
+                        transcribe_with_whisper, content, filename, whisper_model, long_form=long_form,
+                        progress=progress if total == 1 else None, vad=vad
+                    )
+                file_done()
+                return result, None
+            except InferenceQueueFull as e:
+                # Synchronous traffic took the capacity; wait instead of paying for ElevenLabs
+                if attempt >= PARTIAL_QUEUE_RETRIES:
+                    file_done()
+                    return _error_entry(filename, "Transcription capacity exhausted", 503), None
+                attempt += 1
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logging.warning(f"Whisper failed for {filename}, retrying on ElevenLabs: {e}")
+                return None, e
+
+    async def elevenlabs(content: AudioSource, filename: str, whisper_error: Exception):
+        try:
+            return await _transcribe_with_elevenlabs(content, filename, eleven_model, project_id)
+        except Exception as e:
+            logging.error(f"Both transcription methods failed for {filename}: {e}")
+            return _error_entry(
+                filename, f"Whisper: {_error_message(whisper_error)}. ElevenLabs: {_error_message(e)}",
+                e.status_code if isinstance(e, HTTPException) else 500
+            )
+        finally:
+            file_done()
+
+    outcomes = await asyncio.gather(*(whisper(c, f) for c, f in zip(audio_contents, filenames)))
+    results: List[Optional[Dict[str, Any]]] = [result for result, _ in outcomes]
+
+    retries = [index for index, (_, error) in enumerate(outcomes) if error is not None]
+    retried = await asyncio.gather(*(
+        elevenlabs(audio_contents[index], filenames[index], outcomes[index][1]) for index in retries
+    ))
+    for index, result in zip(retries, retried):
+        results[index] = result
+
+    for result, filename in zip(results, filenames):
+        result.setdefault("status", "ok")
+        result.setdefault("filename", filename)
+    return results
+
+
+def _independent_source(content: AudioSource) -> Tuple[AudioSource, Optional[BinaryIO]]:
+    """
+    A second reader for an upload with its own file offset, so both engines can
+    read it at the same time. Returns the source and a handle to close, if any.
+    """
+    if isinstance(content, bytes):
+        return content, None
+    try:
+        # Reopening the descriptor also works for unlinked spool files
+        handle = open(f"/proc/self/fd/{content.fileno()}", "rb")
+        return handle, handle
+    except (OSError, AttributeError, ValueError):
+        content.seek(0)
+        return content.read(), None
+
+
+async def _transcribe_hedged(
+    content: AudioSource,
+    filename: str,
+    whisper_model: str,
+    eleven_model: str,
+    long_form: bool,
+    project_id: Optional[str],
+    progress: Optional[Callable[[float], None]],
+    vad: Optional[bool]
+) -> Dict[str, Any]:
+    """
+    Start Whisper, and if it has not finished within HEDGE_BUDGET_SECONDS (or
+    the inference queue is already deep) start ElevenLabs as well. The first
+    successful result wins and the other request is cancelled; a Whisper run
+    that has already started on a worker thread finishes in the background.
+    """
+    HEDGE_ELIGIBLE.inc()
+    whisper_task = asyncio.ensure_future(inference_executor.run(
+        transcribe_with_whisper, content, filename, whisper_model, long_form=long_form, progress=progress, vad=vad
+    ))
+    budget = 0 if inference_executor.queue_depth >= HEDGE_QUEUE_DEPTH else HEDGE_BUDGET_SECONDS
+    await asyncio.wait({whisper_task}, timeout=budget)
+    if whisper_task.done() and whisper_task.exception() is None:
+        return whisper_task.result()
+
+    hedged = not whisper_task.done()
+    if hedged:
+        HEDGES_FIRED.inc()
+        logging.info(f"Whisper exceeded the {budget:.1f}s budget for {filename}, hedging with ElevenLabs")
+    else:
+        logging.warning(f"Whisper transcription failed, falling back to ElevenLabs: {whisper_task.exception()}")
+
+    async def elevenlabs():
+        source, handle = _independent_source(content) if hedged else (content, None)
+        try:
+            return await _transcribe_with_elevenlabs(source, filename, eleven_model, project_id)
+        finally:
+            if handle:
+                handle.close()
+
+    eleven_task = asyncio.ensure_future(elevenlabs())
+    engines = {whisper_task: "whisper", eleven_task: "elevenlabs"}
+    pending = {task for task in engines if not task.done()}
     try:
-        response = requests.post(
-            ELEVEN_STT_URL,
-            headers=headers,
-            files=files,
-            data=data
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if hedged:
+                        HEDGE_WINS.labels(engine=engines[task]).inc()
+                    return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    whisper_error = whisper_task.exception()
+    eleven_error = eleven_task.exception()
+    if isinstance(whisper_error, InferenceQueueFull):
+        raise whisper_error
+    logging.error(f"Both transcription methods failed: {eleven_error}")
+    raise HTTPException(
+        status_code=500,
+        detail=f"Transcription failed with both engines. Whisper: {_error_message(whisper_error)}. ElevenLabs: {_error_message(eleven_error)}"
+    )
+
+
+async def _transcribe_routed(
+    content: AudioSource,
+    filename: str,
+    whisper_model: str,
+    eleven_model: str,
+    long_form: bool,
+    project_id: Optional[str],
+    progress: Optional[Callable[[float], None]],
+    vad: Optional[bool],
+    hedge: Optional[bool]
+) -> Dict[str, Any]:
+    """
+    Transcribe one file on the engine the routing policy picks. A Whisper
+    route keeps the usual ElevenLabs fallback; an ElevenLabs route falls back
+    to the requested Whisper model.
+    """
+    route = choose_route(content, whisper_model, eleven_model)
+    if route.engine == "whisper":
+        return await transcribe_with_fallback(
+            content, filename, route.model, eleven_model, long_form, project_id, progress, vad,
+            hedge=hedge, route=False
         )
-        
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error calling ElevenLabs Speech-to-Text API: {e}")
-        error_detail = str(e)
-        
-        # Try to extract more detailed error information if available
-        if hasattr(e, 'response') and e.response:
-            try:
-                error_json = e.response.json()
-                if 'detail' in error_json:
-                    error_detail = error_json['detail']
-            except:
-                pass
-                
-        raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {error_detail}")
-
-def transcribe_with_fallback(
-    audio_contents: Union[bytes, List[bytes]], 
+
+    try:
+        return await _transcribe_with_elevenlabs(content, filename, eleven_model, project_id)
+    except Exception as eleven_error:
+        logging.warning(f"ElevenLabs transcription failed, falling back to Whisper: {eleven_error}")
+        try:
+            return await inference_executor.run(
+                transcribe_with_whisper, content, filename, whisper_model, long_form=long_form,
+                progress=progress, vad=vad
+            )
+        except InferenceQueueFull:
+            raise
+        except Exception as whisper_error:
+            logging.error(f"Both transcription methods failed: {whisper_error}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Transcription failed with both engines. ElevenLabs: {_error_message(eleven_error)}. Whisper: {_error_message(whisper_error)}"
+            )
+
+
+async def transcribe_with_fallback(
+    audio_contents: Union[AudioSource, List[AudioSource]], 
     filenames: Union[str, List[str]], 
     whisper_model: str = DEFAULT_WHISPER_MODEL,
-    eleven_model: str = "scribe_v1"
+    eleven_model: str = "scribe_v1",
+    long_form: bool = False,
+    project_id: Optional[str] = None,
+    progress: Optional[Callable[[float], None]] = None,
+    vad: Optional[bool] = None,
+    partial: bool = False,
+    hedge: Optional[bool] = None,
+    route: Optional[bool] = None
 ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
     """
     Transcribe audio using Whisper first, and fall back to ElevenLabs if Whisper fails.
     
     Args:
-        audio_contents: Binary content of one or more audio files
+        audio_contents: Binary content of, or seekable file handles to, one or more audio files
         filenames: Names of the audio files
         whisper_model: Whisper model to use
         eleven_model: ElevenLabs model to use
+        long_form: Use parallel chunked transcription for long Whisper inputs
+        project_id: Project the ElevenLabs fallback is queued under
+        progress: Called with the completed fraction of a single-file Whisper run
+        vad: Skip silence before Whisper (defaults to WHISPER_VAD)
+        partial: Transcribe all files concurrently and return one entry per file with a
+            "status" of "ok" or "error", instead of raising on the first file both engines fail
+        hedge: Race ElevenLabs against Whisper runs that exceed the latency budget
+            (defaults to TRANSCRIBE_HEDGE)
+        route: Let the routing policy pick Whisper, a smaller Whisper model or
+            ElevenLabs per file from queue depth, duration and recent real-time
+            factors (defaults to TRANSCRIBE_ROUTING); not applied in partial mode
         
     Returns:
         Dictionary or list of dictionaries with transcription results
@@ -183,23 +728,53 @@ def transcribe_with_fallback(
         single_input = True
     else:
         single_input = False
+
+    if partial:
+        results = await _transcribe_partial(
+            audio_contents, filenames, whisper_model, eleven_model, long_form, project_id, progress, vad
+        )
+        return results[0] if single_input else results
+
+    if TRANSCRIBE_ROUTING if route is None else route:
+        results = [
+            await _transcribe_routed(
+                content, filename, whisper_model, eleven_model, long_form, project_id,
+                progress if single_input else None, vad, hedge
+            )
+            for content, filename in zip(audio_contents, filenames)
+        ]
+        return results[0] if single_input else results
+
+    if TRANSCRIBE_HEDGE if hedge is None else hedge:
+        results = [
+            await _transcribe_hedged(
+                content, filename, whisper_model, eleven_model, long_form, project_id,
+                progress if single_input else None, vad
+            )
+            for content, filename in zip(audio_contents, filenames)
+        ]
+        return results[0] if single_input else results
     
     results = []
     
     for content, filename in zip(audio_contents, filenames):
         try:
-            # Try Whisper first
-            result = transcribe_with_whisper(content, filename, whisper_model)
+            # Try Whisper first, on the inference pool so the event loop stays free
+            result = await inference_executor.run(
+                transcribe_with_whisper, content, filename, whisper_model, long_form=long_form,
+                progress=progress if single_input else None, vad=vad
+            )
             if isinstance(result, list):
                 result = result[0]  # Get first result since we're processing one file at a time here
             
+        except InferenceQueueFull:
+            # Local capacity exhausted: surface it so the client can retry
+            raise
         except Exception as whisper_error:
             logging.warning(f"Whisper transcription failed, falling back to ElevenLabs: {whisper_error}")
             try:
                 # Fall back to ElevenLabs
-                result = transcribe_audio(content, filename, eleven_model)
-                result["engine"] = "elevenlabs"  # Add engine information
-                result["model"] = eleven_model
+                result = await _transcribe_with_elevenlabs(content, filename, eleven_model, project_id)
             except Exception as eleven_error:
                 # Both methods failed
                 logging.error(f"Both transcription methods failed: {eleven_error}")
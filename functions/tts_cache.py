@@ -0,0 +1,162 @@
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+from prometheus_client import Counter, Gauge
+
+# Constants
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") == "1"
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "audio_service_tts_cache"))
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "1024"))
+CACHE_SUFFIX = ".audio"
+TTS_CACHE_FLUSH_BYTES = 256 * 1024  # chunks are written in batches of this size
+
+TTS_CACHE_HITS = Counter("tts_cache_hits_total", "TTS audio served from the disk cache")
+TTS_CACHE_MISSES = Counter("tts_cache_misses_total", "TTS requests synthesized upstream")
+TTS_CACHE_EVICTIONS = Counter("tts_cache_evictions_total", "TTS audio files evicted from the disk cache")
+TTS_CACHE_BYTES = Gauge("tts_cache_bytes", "Bytes of rendered audio held in the TTS cache")
+
+
+def tts_cache_key(text: str, voice_id: str, model_id: str, output_format: str) -> str:
+    payload = "\x00".join([text, voice_id, model_id, output_format])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class TTSCache:
+    """
+    Content-addressed store of rendered TTS audio on local disk with
+    size-based LRU eviction. Misses are filled by teeing the upstream stream
+    into a partial file that is atomically renamed into place once complete.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Rebuild the LRU order from disk, least recently used first
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".part"):
+                os.unlink(path)
+            elif name.endswith(CACHE_SUFFIX):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-len(CACHE_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+        with self._lock:
+            self._evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{CACHE_SUFFIX}")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Path of the cached audio for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                path = self.path(key)
+                try:
+                    os.utime(path)  # keeps the LRU order across restarts
+                except FileNotFoundError:
+                    self._entries.pop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    TTS_CACHE_HITS.inc()
+                    return path
+        TTS_CACHE_MISSES.inc()
+        return None
+
+    async def tee(self, key: str, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Yield the upstream chunks to the client while writing them to the
+        cache. Chunks are buffered and written in batches on a worker thread,
+        so disk writes never block the event loop. If the cache cannot be
+        written, caching stops and the audio is still relayed.
+        """
+        partial_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.part")
+        partial = None
+        buffer = bytearray()
+        completed = False
+        try:
+            try:
+                partial = await asyncio.to_thread(open, partial_path, "wb")
+            except OSError as e:
+                logging.warning(f"Not caching TTS audio {key}: {e}")
+            async for chunk in stream:
+                if chunk:
+                    yield chunk
+                    if partial is not None:
+                        buffer += chunk
+                        if len(buffer) >= TTS_CACHE_FLUSH_BYTES:
+                            partial = await self._write(key, partial, buffer)
+            if partial is not None:
+                partial = await self._write(key, partial, buffer)
+                completed = partial is not None
+        finally:
+            try:
+                await asyncio.to_thread(self._finish, key, partial, partial_path, completed)
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+    async def _write(self, key: str, partial, buffer: bytearray):
+        """Flush the buffer to the partial file; on failure give it up and return None"""
+        try:
+            await asyncio.to_thread(partial.write, bytes(buffer))
+        except OSError as e:
+            logging.warning(f"Stopped caching TTS audio {key}: {e}")
+            await asyncio.to_thread(self._finish, key, partial, None, False)
+            return None
+        finally:
+            buffer.clear()
+        return partial
+
+    def _finish(self, key: str, partial, partial_path: Optional[str], completed: bool):
+        """Close the partial file, then publish it if complete or remove it"""
+        try:
+            if partial is not None and not partial.closed:
+                partial.close()
+            if completed:
+                self._commit(key, partial_path)
+                return
+        except OSError as e:
+            logging.warning(f"Not caching TTS audio {key}: {e}")
+        if partial_path is not None:
+            # Upstream error, client disconnect or failed write: never cache truncated audio
+            try:
+                os.unlink(partial_path)
+            except FileNotFoundError:
+                pass
+
+    def _commit(self, key: str, partial_path: str):
+        size = os.path.getsize(partial_path)
+        os.replace(partial_path, self.path(key))
+        with self._lock:
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._entries.values())
+        while self._entries and total > self.max_bytes:
+            key, size = self._entries.popitem(last=False)
+            total -= size
+            try:
+                os.unlink(self.path(key))
+            except FileNotFoundError:
+                pass
+            TTS_CACHE_EVICTIONS.inc()
+            logging.info(f"Evicted cached TTS audio {key} ({size} bytes)")
+        TTS_CACHE_BYTES.set(total)
+
+
+tts_cache = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 2**20) if TTS_CACHE_ENABLED else None
@@ -9,7 +9,13 @@ from prometheus_fastapi_instrumentator import Instrumentator
 from contextlib import asynccontextmanager
 import time
 import json
-from routes import api_router  
+import asyncio
+from routes import api_router, has_role
+from functions.inference_executor import inference_executor
+from functions.http_client import init_http_client, close_http_client
+from functions.resilience import circuit_states
+from functions.ingest import UploadSizeLimitMiddleware
+from functions.timing import SERVER_TIMING_HEADER, end_request_timing, server_timing_header, start_request_timing
 from fastapi.middleware.cors import CORSMiddleware
 
 logging.basicConfig(
@@ -22,9 +28,24 @@ service_registry = ServiceRegistry()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await init_http_client()
+    if has_role("stt"):
+        # Imported here so workers without the stt role never load whisper/torch
+        from functions.jobs import job_workers
+        from functions.transcription import preload_models
+        # Warm models in the background: /health/live answers meanwhile, /health/ready does not
+        preload = asyncio.create_task(inference_executor.run(preload_models))
+        job_workers.start()
     service_registry.register_service()
     service_registry.start_heartbeat()
     yield
+    if has_role("stt"):
+        from functions.longform import shutdown_pool as shutdown_long_form_pool
+        preload.cancel()
+        await job_workers.stop()
+        shutdown_long_form_pool()
+    await close_http_client()
+    inference_executor.shutdown()
     service_registry.deregister_service()
     
 app = FastAPI(
@@ -44,6 +65,9 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Oversized uploads are refused while they stream in, not after buffering
+app.add_middleware(UploadSizeLimitMiddleware)
+
 
 Instrumentator().instrument(app).expose(app)
 
@@ -63,10 +87,12 @@ async def log_requests(request: Request, call_next):
     start_time = time.time()
     path = request.url.path
     method = request.method
+    timing_token = start_request_timing()
     
     try:
         response = await call_next(request)
         process_time = time.time() - start_time
+        stages = end_request_timing(timing_token)
         
         log_data = {
             "method": method,
@@ -74,11 +100,17 @@ async def log_requests(request: Request, call_next):
             "status_code": response.status_code,
             "processing_time_ms": round(process_time * 1000, 2)
         }
+        if stages:
+            log_data["stages_ms"] = {name: round(duration, 2) for name, duration in stages.items()}
+            if SERVER_TIMING_HEADER:
+                stages["total"] = process_time * 1000
+                response.headers["Server-Timing"] = server_timing_header(stages)
         logger.info(f"Request processed: {json.dumps(log_data)}")
         
         return response
     except Exception as e:
         process_time = time.time() - start_time
+        end_request_timing(timing_token)
         log_data = {
             "method": method,
             "path": path,
@@ -102,11 +134,30 @@ def health_check():
     try:
         db = database.SessionLocal()
         db.close()
-        return {"status": "healthy"}
+        # An open upstream circuit degrades TTS/fallback but local work still runs
+        circuits = circuit_states()
+        status = "healthy" if all(state == "closed" for state in circuits.values()) else "degraded"
+        return {"status": status, "circuits": circuits}
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
     
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness_check():
+    """Ready for traffic once the preloaded models are warm and the database is reachable"""
+    if has_role("stt"):
+        from functions.transcription import models_ready
+        if not models_ready():
+            raise HTTPException(status_code=503, detail="Models are still loading")
+    return health_check()
+
+    
 @app.on_event("startup")
 def startup_db_client():
     database.Base.metadata.create_all(bind=database.engine)
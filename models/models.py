@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Table, Boolean
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Table, Boolean, Float, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
@@ -14,4 +14,23 @@ class Voice(Base):
     description = Column(String, nullable=True)
     voice_id = Column(String, nullable=False)  # ElevenLabs reference
     label = Column(String, nullable=True)
-    project_id = Column(UUID(as_uuid=True))
\ No newline at end of file
+    project_id = Column(UUID(as_uuid=True))
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, completed, failed
+    progress = Column(Float, nullable=False, default=0.0)
+    filename = Column(String, nullable=False)
+    audio_path = Column(String, nullable=True)  # spooled upload, deleted once the job finishes
+    options = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    callback_url = Column(String, nullable=True)
+    project_id = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_until = Column(DateTime, nullable=True)  # worker lease, extended while running
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
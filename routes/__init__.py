@@ -1,8 +1,25 @@
+import os
 from fastapi import APIRouter
-from routes.speech_routes import router as speech_router
-from routes.voice_routes import router as voice_router
-api_router = APIRouter()
 
+# Which parts of the API this process serves, e.g. "tts,voices" for workers
+# that should never import the Whisper/torch stack
+AUDIO_SERVICE_ROLES = {
+    role.strip() for role in os.getenv("AUDIO_SERVICE_ROLES", "tts,stt,voices").split(",") if role.strip()
+}
+
+
+def has_role(role: str) -> bool:
+    return role in AUDIO_SERVICE_ROLES
+
+
+api_router = APIRouter()
 
-api_router.include_router(speech_router, prefix="/speech", tags=["Speech"])
-api_router.include_router(voice_router, prefix="/voices", tags=["Voices"])
\ No newline at end of file
+if has_role("tts"):
+    from routes.speech_routes import router as speech_router
+    api_router.include_router(speech_router, prefix="/speech", tags=["Speech"])
+if has_role("stt"):
+    from routes.transcription_routes import router as transcription_router
+    api_router.include_router(transcription_router, prefix="/speech", tags=["Speech"])
+if has_role("voices"):
+    from routes.voice_routes import router as voice_router
+    api_router.include_router(voice_router, prefix="/voices", tags=["Voices"])
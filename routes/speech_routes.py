@@ -1,11 +1,15 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException
 from functions.eleven_api import generate_speech, stream_speech
-from functions.transcription import DEFAULT_WHISPER_MODEL, transcribe_with_fallback
-from fastapi.responses import StreamingResponse
+from functions.tts_cache import tts_cache, tts_cache_key
+from functions.streaming import relay_stream
+from functions.long_tts import supports_chunked_synthesis, synthesize_long_text
+from functions.coalescing import tts_fanout
+from fastapi.responses import StreamingResponse, FileResponse
 import logging
 
-# Will contain text-to-speech and speech-to-text routes
+# Text-to-speech routes; speech-to-text lives in transcription_routes
 
 router = APIRouter()
 
@@ -14,18 +18,44 @@ class TextToSpeechRequest(BaseModel):
     voice_id: str = "JBFqnCBsd6RMkjVDRZzb"
     output_format: str = "mp3_44100_128"
     model_id: str = "eleven_multilingual_v2"
+    long_text: bool = False  # synthesize sentence chunks in parallel
+    project_id: Optional[str] = None  # fair share of the ElevenLabs quota
 
 
 @router.post("/text-to-speech")
-def text_to_speech(request: TextToSpeechRequest):
+async def text_to_speech(request: TextToSpeechRequest):
     try:
-        audio_stream = generate_speech(
-            text=request.text,
-            voice_id=request.voice_id,
-            output_format=request.output_format,
-            model_id=request.model_id
-        )
-        return StreamingResponse(audio_stream, media_type="audio/mpeg")
+        cache_key = tts_cache_key(request.text, request.voice_id, request.model_id, request.output_format)
+        cached_path = tts_cache.lookup(cache_key) if tts_cache else None
+        if cached_path:
+            # FileResponse uses zero-copy sendfile where the server supports it
+            return FileResponse(cached_path, media_type="audio/mpeg", headers={"X-Cache": "HIT"})
+
+        async def open_stream():
+            if request.long_text and supports_chunked_synthesis(request.output_format):
+                audio_stream = await synthesize_long_text(
+                    text=request.text,
+                    voice_id=request.voice_id,
+                    output_format=request.output_format,
+                    model_id=request.model_id,
+                    project_id=request.project_id
+                )
+            else:
+                audio_stream = await generate_speech(
+                    text=request.text,
+                    voice_id=request.voice_id,
+                    output_format=request.output_format,
+                    model_id=request.model_id,
+                    project_id=request.project_id
+                )
+            return tts_cache.tee(cache_key, audio_stream) if tts_cache else audio_stream
+
+        # Identical concurrent requests share one upstream stream
+        audio_stream = await tts_fanout.subscribe(cache_key, open_stream)
+        return StreamingResponse(relay_stream(audio_stream), media_type="audio/mpeg", headers={"X-Cache": "MISS"})
+    except HTTPException as e:
+        # Keep upstream 429/503 (with Retry-After) visible to the client
+        raise e
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
@@ -36,55 +66,33 @@ class StreamSpeechRequest(BaseModel):
     voice_id: str # default "LPJ71OSKKaosXFK91Zee"
     model_id: str # default "eleven_multilingual_v2"
     output_format: str # default "mp3_44100_128"
+    project_id: Optional[str] = None
 
 @router.post("/stream")
-def stream_speech_route(request: StreamSpeechRequest):
+async def stream_speech_route(request: StreamSpeechRequest):
     """
     Stream text-to-speech using ElevenLabs API
     """
     try:
-        audio_stream = stream_speech(
-            text=request.text,
-            voice_id=request.voice_id,
-            model_id=request.model_id,
-            output_format=request.output_format
-        )
-        return StreamingResponse(audio_stream, media_type="audio/mpeg")
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        logging.error(f"Unexpected error in stream_speech: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
-    
-@router.post("/transcribe")  # Remove response_model to debug
-async def transcribe_speech(
-    file: UploadFile = File(...),
-    model_id: str = Form("scribe_v1"),
-    whisper_model: str = Form(DEFAULT_WHISPER_MODEL)
-):
-    """
-    Transcribe an audio file to text using Whisper with ElevenLabs as fallback
-    """
-    try:
-        # Read the file content
-        file_content = await file.read()
+        cache_key = tts_cache_key(request.text, request.voice_id, request.model_id, request.output_format)
+        cached_path = tts_cache.lookup(cache_key) if tts_cache else None
+        if cached_path:
+            return FileResponse(cached_path, media_type="audio/mpeg", headers={"X-Cache": "HIT"})
 
-        # Call the transcribe_with_fallback function
-        transcription_result = transcribe_with_fallback(
-            audio_contents=file_content,
-            filenames=file.filename,
-            whisper_model=whisper_model,
-            eleven_model=model_id
-        )
+        async def open_stream():
+            audio_stream = await stream_speech(
+                text=request.text,
+                voice_id=request.voice_id,
+                model_id=request.model_id,
+                output_format=request.output_format,
+                project_id=request.project_id
+            )
+            return tts_cache.tee(cache_key, audio_stream) if tts_cache else audio_stream
 
-        # For debugging: Print the result structure
-        logging.debug(f"Transcription result keys: {transcription_result.keys() if isinstance(transcription_result, dict) else 'Not a dict'}")
-        
-        return transcription_result
+        audio_stream = await tts_fanout.subscribe(cache_key, open_stream)
+        return StreamingResponse(relay_stream(audio_stream), media_type="audio/mpeg", headers={"X-Cache": "MISS"})
     except HTTPException as e:
         raise e
     except Exception as e:
-        logging.error(f"Error transcribing speech: {e}")
-        raise HTTPException(
-            status_code=500, detail=f"Failed to transcribe audio: {str(e)}")
-
+        logging.error(f"Unexpected error in stream_speech: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
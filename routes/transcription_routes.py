@@ -0,0 +1,398 @@
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from functions.transcription import DEFAULT_WHISPER_MODEL, TRANSCRIBE_HEDGE, transcribe_with_fallback
+from functions.routing import TRANSCRIBE_ROUTING
+from functions.inference_executor import InferenceQueueFull, inference_executor
+from functions.cache import transcription_cache, transcription_cache_key
+from functions.coalescing import transcription_flight
+from functions.timing import stage
+from functions.ingest import duplicate_handle, expand_uploads, hash_file, hash_upload
+from functions.audio import FFmpegStreamDecoder, pcm16_to_float
+from functions.streaming_stt import STREAM_STT_MIN_CHUNK_SECONDS, StreamingTranscriber
+from functions.jobs import JOB_STATUS_COMPLETED, JOB_STATUS_FAILED, InvalidCallbackUrl, submit_job, validate_callback_url
+from models.models import TranscriptionJob
+from schemas.voice import TranscriptionJobResponse
+from database import get_db
+from sqlalchemy.orm import Session
+from uuid import UUID
+import os
+import json
+import asyncio
+import logging
+
+# Speech-to-text routes. Only imported when the service runs the "stt" role,
+# so TTS and voice workers never load the Whisper stack.
+
+router = APIRouter()
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(inference_executor.workers)))
+
+async def _transcribe_file(
+    audio: BinaryIO,
+    filename: str,
+    content_hash: str,
+    whisper_model: str,
+    eleven_model: str,
+    long_form: bool,
+    vad: Optional[bool],
+    project_id: Optional[str],
+    hedge: Optional[bool] = None,
+    route: Optional[bool] = None,
+    partial: bool = False
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Transcribe one file through the result cache and single-flight. With
+    partial, a failure comes back as an uncached entry with "status": "error"
+    instead of being raised.
+
+    Returns:
+        (result, cache tier it was served from, or None if it was transcribed)
+    """
+    hedge = TRANSCRIBE_HEDGE if hedge is None else hedge
+    route = TRANSCRIBE_ROUTING if route is None else route
+
+    def key_for(model: str, hedged: bool, routed: bool) -> str:
+        return transcription_cache_key(
+            content_hash,
+            engines="whisper+elevenlabs",
+            whisper_model=model,
+            eleven_model=eleven_model,
+            long_form=long_form,
+            vad=vad,
+            hedge=hedged,
+            route=routed
+        )
+
+    # Identical audio with identical options is served from the cache
+    cache_key = key_for(whisper_model, hedge, route)
+    with stage("cache_lookup"):
+        cached_result, cache_tier = await transcription_cache.aget(cache_key)
+    if cached_result is not None:
+        return cached_result, cache_tier
+
+    async def transcribe():
+        # The job is shielded and outlives a leader that is cancelled or
+        # finishes first, whose upload is then closed; read through a handle
+        # the job owns
+        with duplicate_handle(audio) as owned:
+            return await run(owned)
+
+    async def run(owned: BinaryIO):
+        # Whisper runs on the inference pool, off the event loop
+        result = await transcribe_with_fallback(
+            audio_contents=owned,
+            filenames=filename,
+            whisper_model=whisper_model,
+            eleven_model=eleven_model,
+            long_form=long_form,
+            project_id=project_id,
+            vad=vad,
+            hedge=hedge,
+            route=route,
+            partial=partial
+        )
+        if partial:
+            if result["status"] == "error":
+                return result
+            result = {key: value for key, value in result.items() if key not in ("status", "filename")}
+        if result.get("engine") == "whisper" and result.get("model") != whisper_model:
+            # The router downgraded the model: file the result under a plain
+            # request for the model that actually ran, never the requested one
+            await transcription_cache.aset(key_for(result["model"], False, False), result)
+        else:
+            await transcription_cache.aset(cache_key, result)
+        return result
+
+    # Identical uploads in flight at the same time are transcribed once. A
+    # partial job returns errors as entries while a plain one raises them,
+    # so the two never share a flight
+    flight_key = f"{cache_key}:partial" if partial else cache_key
+    return await transcription_flight.do(flight_key, transcribe), None
+
+
+@router.post("/transcribe")  # Remove response_model to debug
+async def transcribe_speech(
+    response: Response,
+    file: UploadFile = File(...),
+    model_id: str = Form("scribe_v1"),
+    whisper_model: str = Form(DEFAULT_WHISPER_MODEL),
+    long_form: bool = Form(False),
+    vad: Optional[bool] = Form(None),
+    project_id: Optional[str] = Form(None),
+    hedge: Optional[bool] = Form(None),
+    route: Optional[bool] = Form(None)
+):
+    """
+    Transcribe an audio file to text using Whisper with ElevenLabs as fallback.
+    With hedge, ElevenLabs also races Whisper runs that exceed the latency budget.
+    With route, the engine (and Whisper model) is picked from the current load;
+    the response's engine and model fields show which one ran.
+    """
+    try:
+        # Starlette has already spooled the upload to disk; hash it in chunks
+        # and hand the file handle on instead of reading it into memory
+        content_hash, _ = await hash_upload(file)
+
+        transcription_result, cache_tier = await _transcribe_file(
+            file.file, file.filename, content_hash, whisper_model, model_id, long_form, vad, project_id, hedge, route
+        )
+        if cache_tier:
+            response.headers["X-Cache"] = "HIT"
+            response.headers["X-Cache-Tier"] = cache_tier
+        else:
+            response.headers["X-Cache"] = "MISS"
+
+        # For debugging: Print the result structure
+        logging.debug(f"Transcription result keys: {transcription_result.keys() if isinstance(transcription_result, dict) else 'Not a dict'}")
+        
+        return transcription_result
+    except InferenceQueueFull as e:
+        logging.warning("Inference queue full, rejecting transcription request")
+        raise HTTPException(
+            status_code=503,
+            detail="Transcription capacity exhausted, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logging.error(f"Error transcribing speech: {e}")
+        raise HTTPException(
+            status_code=500, detail=f"Failed to transcribe audio: {str(e)}")
+
+
+@router.post("/transcribe/batch")
+async def transcribe_batch(
+    files: List[UploadFile] = File(...),
+    model_id: str = Form("scribe_v1"),
+    whisper_model: str = Form(DEFAULT_WHISPER_MODEL),
+    long_form: bool = Form(False),
+    vad: Optional[bool] = Form(None),
+    project_id: Optional[str] = Form(None)
+):
+    """
+    Transcribe many audio files, or zip archives of them, in parallel. Results
+    stream back as NDJSON in completion order: one line per file with
+    "status": "ok" and the result, or "status": "error" with the error, and a
+    final summary line. A failing file never fails the rest of the batch.
+    """
+    items, handles = await expand_uploads(files)
+    if not items:
+        for handle in handles:
+            handle.close()
+        raise HTTPException(status_code=400, detail="The batch contains no audio files")
+
+    # Keep the batch within what the inference executor accepts
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def transcribe_item(index: int, filename: str, audio: BinaryIO) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"index": index, "filename": filename}
+        async with semaphore:
+            try:
+                content_hash, _ = await hash_file(audio)
+                # Partial mode waits out a full inference queue and reports failures as entries
+                result, cache_tier = await _transcribe_file(
+                    audio, filename, content_hash, whisper_model, model_id, long_form, vad, project_id,
+                    partial=True
+                )
+                if result.get("status") == "error":
+                    entry.update(status="error", status_code=result["status_code"], error=result["error"])
+                else:
+                    entry.update(status="ok", cache=cache_tier or "MISS", result=result)
+            except HTTPException as e:
+                entry.update(status="error", status_code=e.status_code, error=str(e.detail))
+            except Exception as e:
+                logging.error(f"Error transcribing {filename} in batch: {e}")
+                entry.update(status="error", status_code=500, error=str(e))
+        return entry
+
+    tasks = [
+        asyncio.create_task(transcribe_item(index, filename, audio))
+        for index, (filename, audio) in enumerate(items)
+    ]
+
+    async def results():
+        succeeded = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                entry = await next_done
+                if entry["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield json.dumps(entry) + "\n"
+            yield json.dumps({"done": True, "total": len(items), "succeeded": succeeded, "failed": failed}) + "\n"
+        finally:
+            # Client gone: stop the remaining work
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for handle in handles:
+                handle.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.post("/transcribe/jobs", status_code=202, response_model=TranscriptionJobResponse)
+async def submit_transcription_job(
+    file: UploadFile = File(...),
+    model_id: str = Form("scribe_v1"),
+    whisper_model: str = Form(DEFAULT_WHISPER_MODEL),
+    long_form: bool = Form(False),
+    vad: Optional[bool] = Form(None),
+    project_id: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue an audio file for transcription and return the job immediately.
+    Poll the job for progress, or pass callback_url (a public http(s) URL) to
+    be notified when it finishes.
+    """
+    if callback_url:
+        try:
+            await run_in_threadpool(validate_callback_url, callback_url)
+        except InvalidCallbackUrl as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    try:
+        options = {
+            "whisper_model": whisper_model,
+            "eleven_model": model_id,
+            "long_form": long_form,
+            "vad": vad,
+        }
+        # Copied from Starlette's spool to the job spool in chunks, never into memory
+        return await run_in_threadpool(
+            submit_job, db, file.file, file.filename, options, callback_url, project_id
+        )
+    except Exception as e:
+        logging.error(f"Error submitting transcription job: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue transcription: {str(e)}")
+
+
+def _get_job(job_id: UUID, db: Session) -> TranscriptionJob:
+    job = db.get(TranscriptionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Transcription job not found")
+    return job
+
+
+@router.get("/transcribe/jobs/{job_id}", response_model=TranscriptionJobResponse)
+def get_transcription_job(job_id: UUID, db: Session = Depends(get_db)):
+    """Status and progress of a transcription job"""
+    return _get_job(job_id, db)
+
+
+@router.get("/transcribe/jobs/{job_id}/result")
+def get_transcription_job_result(job_id: UUID, db: Session = Depends(get_db)):
+    """Transcription of a completed job"""
+    job = _get_job(job_id, db)
+    if job.status == JOB_STATUS_FAILED:
+        raise HTTPException(status_code=422, detail=f"Transcription failed: {job.error}")
+    if job.status != JOB_STATUS_COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Transcription job is {job.status}")
+    return job.result
+
+
+@router.websocket("/transcribe/stream")
+async def transcribe_stream(
+    websocket: WebSocket,
+    encoding: str = "pcm_s16le",
+    whisper_model: str = DEFAULT_WHISPER_MODEL,
+    language: Optional[str] = None
+):
+    """
+    Live transcription. The client sends binary audio frames, either raw
+    16 kHz mono pcm_s16le or a compressed stream such as Opus in Ogg/WebM
+    (encoding=opus), then a text message "stop" (or closes the socket).
+    The server replies with JSON messages: {"type": "partial", ...} with the
+    current unstable words and {"type": "final", ...} with newly committed
+    words, each word carrying start/end timestamps in seconds.
+    """
+    # HTTP middleware does not see WebSocket handshakes, so check the gateway here
+    if websocket.headers.get("X-From-Gateway") != "true":
+        logging.warning("Direct WebSocket access attempt to /speech/transcribe/stream - Forbidden")
+        await websocket.close(code=1008)
+        return
+    if encoding not in ("pcm_s16le", "opus"):
+        await websocket.close(code=1003, reason=f"Unsupported encoding: {encoding}")
+        return
+
+    await websocket.accept()
+    transcriber = StreamingTranscriber(whisper_model, language=language)
+    decoder = FFmpegStreamDecoder() if encoding == "opus" else None
+    audio_arrived = asyncio.Event()
+    stopped = False
+    disconnected = False
+
+    async def receive():
+        nonlocal stopped, disconnected
+        remainder = b""
+        try:
+            if decoder:
+                await decoder.start()
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    disconnected = True
+                    break
+                if message.get("bytes"):
+                    if decoder:
+                        await decoder.write(message["bytes"])
+                        transcriber.insert_audio(decoder.read())
+                    else:
+                        data = remainder + message["bytes"]
+                        usable = len(data) - len(data) % 2
+                        remainder = data[usable:]
+                        transcriber.insert_audio(pcm16_to_float(data[:usable]))
+                    audio_arrived.set()
+                elif message.get("text") == "stop":
+                    break
+            if decoder:
+                transcriber.insert_audio(await decoder.finish())
+        finally:
+            stopped = True
+            audio_arrived.set()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while not stopped:
+            await audio_arrived.wait()
+            audio_arrived.clear()
+            if stopped or transcriber.pending_seconds < STREAM_STT_MIN_CHUNK_SECONDS:
+                continue
+            try:
+                committed, partial = await inference_executor.run(transcriber.process)
+            except InferenceQueueFull:
+                # Keep buffering; the next step transcribes everything that arrived meanwhile
+                await asyncio.sleep(STREAM_STT_MIN_CHUNK_SECONDS)
+                audio_arrived.set()
+                continue
+            if committed:
+                await websocket.send_json({"type": "final", "words": committed, "text": " ".join(w["text"] for w in committed)})
+            await websocket.send_json({"type": "partial", "words": partial, "text": " ".join(w["text"] for w in partial)})
+
+        await receiver
+        if disconnected:
+            logging.info("Streaming transcription client disconnected")
+            return
+        committed = await inference_executor.run(transcriber.finish)
+        await websocket.send_json({
+            "type": "final",
+            "words": committed,
+            "text": " ".join(w["text"] for w in committed),
+            "transcript": transcriber.text,
+            "is_last": True,
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        logging.info("Streaming transcription client disconnected")
+    except Exception as e:
+        logging.error(f"Error in streaming transcription: {e}")
+        await websocket.close(code=1011)
+    finally:
+        receiver.cancel()
+        if decoder:
+            await decoder.close()
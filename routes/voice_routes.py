@@ -6,23 +6,17 @@ from database import get_db
 import os
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, Form, HTTPException, File, UploadFile
-from typing import List
-from elevenlabs import ElevenLabs
-from functions.eleven_api import get_voice_settings, update_voice_settings, delete_voice_eleven
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from functions.eleven_api import add_voice, get_voice_settings, update_voice_settings, delete_voice_eleven
 from functions.voice import create_voice_to_pg
 import logging
 from schemas.voice import VoiceResponse, VoiceSettingsModel
 
 load_dotenv()
 
-ELEVEN_URL = "https://api.elevenlabs.io/v1/voices/add"
-ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
 HUME_API_KEY = os.getenv("HUME_API_KEY")
 
-client = ElevenLabs(
-    api_key=ELEVEN_API_KEY,
-)
-
 router = APIRouter()
 
 @router.post("/", response_model=VoiceResponse)
@@ -35,28 +29,14 @@ async def create_voice(
     db: Session = Depends(get_db),
 ):
     # TBD what if project does not exist - error handling
-    client = ElevenLabs(api_key=ELEVEN_API_KEY)
+    # Starlette has spooled the samples to disk; stream them upstream from there
+    files_payload = [(sample.filename, sample.file) for sample in samples]
 
-    # Read all the sample files
-    files_payload = []
-    for sample in samples:
-        contents = await sample.read()
-        files_payload.append((sample.filename, contents))
+    # Call ElevenLabs over the shared client to create a new voice
+    resp = await add_voice(name=name, files=files_payload, project_id=str(project_id))
 
-    # Call the ElevenLabs client to create a new voice
-    try:
-        resp = client.voices.add(
-            name=name,
-            files=files_payload
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Error calling ElevenLabs: {str(e)}")
-
-    # Access the voice_id directly as an attribute
-    try:
-        voice_id = resp.voice_id
-    except AttributeError:
+    voice_id = resp.get("voice_id")
+    if not voice_id:
         raise HTTPException(
             status_code=500, detail="ElevenLabs response did not contain a voice_id")
 
@@ -107,25 +87,35 @@ def rename_voice(voice_id: UUID, request: RenameVoiceRequest, db: Session = Depe
     db.commit()
     return voice
 
-@router.delete("/{voice_id}")
-def delete_voice(voice_id: UUID, db: Session = Depends(get_db)):
+def _delete_voice_row(db: Session, voice_id: UUID) -> Optional[str]:
+    """Delete the voice row; returns its ElevenLabs voice ID, or None if there was no row"""
     voice = db.query(Voice).filter(Voice.id == voice_id).first()
     if not voice:
-        raise HTTPException(status_code=404, detail="Voice not found")
+        return None
+    eleven_voice_id = voice.voice_id
     db.delete(voice)
     db.commit()
-    delete_voice_eleven(voice.voice_id)
+    return eleven_voice_id
+
+
+@router.delete("/{voice_id}")
+async def delete_voice(voice_id: UUID, db: Session = Depends(get_db)):
+    # The session is synchronous; keep its queries off the event loop
+    eleven_voice_id = await run_in_threadpool(_delete_voice_row, db, voice_id)
+    if eleven_voice_id is None:
+        raise HTTPException(status_code=404, detail="Voice not found")
+    await delete_voice_eleven(eleven_voice_id)
     return {"detail": "Voice deleted successfully"}
 
 
 
 @router.get("/{voice_id}/settings")
-def get_voice_settings_route(voice_id: str):
+async def get_voice_settings_route(voice_id: str):
     """
     Get voice settings for a specific ElevenLabs voice ID
     """
     try:
-        settings = get_voice_settings(voice_id)
+        settings = await get_voice_settings(voice_id)
         return settings
     except HTTPException as e:
         raise e
@@ -137,12 +127,12 @@ def get_voice_settings_route(voice_id: str):
 
 
 @router.post("/{voice_id}/settings")
-def update_voice_settings_route(voice_id: str, settings: VoiceSettingsModel):
+async def update_voice_settings_route(voice_id: str, settings: VoiceSettingsModel):
     """
     Update voice settings for a specific ElevenLabs voice ID
     """
     try:
-        updated_settings = update_voice_settings(voice_id, settings.dict(exclude_none=True))
+        updated_settings = await update_voice_settings(voice_id, settings.dict(exclude_none=True))
         return updated_settings
     except HTTPException as e:
         raise e
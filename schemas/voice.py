@@ -1,6 +1,7 @@
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from uuid import UUID
+from datetime import datetime
 
 class TranscriptionWord(BaseModel):
     text: str
@@ -20,6 +21,21 @@ class TranscriptionResponse(BaseModel):
     engine: Optional[str] 
     model: Optional[str]
     confidence: Optional[float] 
+    speech_ratio: Optional[float]
+
+
+class TranscriptionJobResponse(BaseModel):
+    id: UUID
+    status: str
+    progress: float
+    filename: str
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
 
 
 class VoiceSettingsModel(BaseModel):
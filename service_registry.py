@@ -38,7 +38,7 @@ class ServiceRegistry:
                 address=container_ip, 
                 port=self.service_port,
                 check={
-                    "http": f"http://{container_ip}:{self.service_port}/health",
+                    "http": f"http://{container_ip}:{self.service_port}/health/ready",
                     "interval": "15s",
                     "timeout": "5s"
                 }
@@ -0,0 +1,50 @@
+import io
+import os
+import sys
+import tempfile
+import wave
+import pytest
+
+# Run against the SQLite test database and import modules from the repo root
+os.environ.setdefault("TESTING", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def wav_bytes():
+    """Factory for a 440 Hz tone as 16-bit PCM WAV bytes"""
+    import numpy as np
+    from functions.audio import SAMPLE_RATE
+
+    def make(seconds: float, rate: int = SAMPLE_RATE, channels: int = 1) -> bytes:
+        samples = int(seconds * rate)
+        tone = (np.sin(np.arange(samples) * 2 * np.pi * 440 / rate) * 8000).astype("<i2")
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(np.repeat(tone, channels).tobytes())
+        return buffer.getvalue()
+
+    return make
+
+
+@pytest.fixture
+def spooled_upload():
+    """Factory for a file like Starlette's spooled upload, already read once (e.g. hashed)"""
+    uploads = []
+
+    def make(data: bytes):
+        upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        uploads.append(upload)
+        upload.write(data)
+        upload.seek(0)
+        while upload.read(8192):
+            pass
+        upload.seek(0)
+        return upload
+
+    yield make
+    for upload in uploads:
+        upload.close()
@@ -0,0 +1,62 @@
+import shutil
+import numpy as np
+import pytest
+from functions.audio import SAMPLE_RATE, decode_audio, detect_speech
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+def test_decode_wav_from_spooled_upload(wav_bytes, spooled_upload):
+    data = wav_bytes(60)
+    assert len(data) > 1024 * 1024
+    with spooled_upload(data) as upload:
+        audio = decode_audio(upload, "speech.wav")
+    assert len(audio) == 60 * SAMPLE_RATE
+
+
+def test_decode_wav_from_bytes(wav_bytes):
+    assert len(decode_audio(wav_bytes(2), "speech.wav")) == 2 * SAMPLE_RATE
+
+
+@requires_ffmpeg
+def test_decode_resampled_wav_from_spooled_upload(wav_bytes, spooled_upload):
+    # 44.1 kHz goes through ffmpeg on the upload's file descriptor
+    data = wav_bytes(30, rate=44100, channels=2)
+    with spooled_upload(data) as upload:
+        audio = decode_audio(upload, "speech.wav")
+        # The handle is still usable from the start for another reader
+        upload.seek(0)
+        assert upload.read() == data
+    assert abs(len(audio) - 30 * SAMPLE_RATE) <= SAMPLE_RATE // 100
+
+
+def _signal(*parts):
+    """Concatenate (seconds, amplitude) stretches of a 440 Hz tone over faint noise"""
+    rng = np.random.default_rng(0)
+    pieces = []
+    for seconds, amplitude in parts:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        pieces.append(amplitude * np.sin(2 * np.pi * 440 * t) + rng.normal(0, 1e-4, len(t)))
+    return np.concatenate(pieces).astype(np.float32)
+
+
+def test_detect_speech_finds_padded_regions():
+    audio = _signal((1, 0), (2, 0.3), (2, 0), (1, 0.3), (1, 0))
+    regions = detect_speech(audio, pad_ms=200)
+    assert len(regions) == 2
+    frame, pad = SAMPLE_RATE * 30 // 1000, SAMPLE_RATE // 5
+    for (start, end), (expected_start, expected_end) in zip(regions, [(1, 3), (5, 6)]):
+        assert abs(start - (expected_start * SAMPLE_RATE - pad)) <= frame
+        assert abs(end - (expected_end * SAMPLE_RATE + pad)) <= frame
+
+
+def test_detect_speech_bridges_short_pauses_and_drops_short_bursts():
+    bridged = _signal((1, 0), (1, 0.3), (0.3, 0), (1, 0.3), (1, 0))
+    assert len(detect_speech(bridged)) == 1
+    click = _signal((1, 0), (0.1, 0.3), (1, 0))
+    assert detect_speech(click) == []
+
+
+def test_detect_speech_on_silence():
+    assert detect_speech(_signal((3, 0))) == []
+    assert detect_speech(np.zeros(0, dtype=np.float32)) == []
@@ -0,0 +1,124 @@
+import gc
+import asyncio
+from functions import coalescing
+from functions.coalescing import StreamFanout
+
+
+def upstream(count=None, gate=None, gate_after=None):
+    """open_stream factory for a source of numbered chunks; records opens, reads and closes"""
+    state = {"opened": 0, "produced": 0, "closed": 0}
+
+    async def open_stream():
+        state["opened"] += 1
+
+        async def chunks():
+            try:
+                i = 0
+                while count is None or i < count:
+                    if gate is not None and i == gate_after:
+                        await gate.wait()
+                    state["produced"] += 1
+                    yield str(i).encode()
+                    i += 1
+                    await asyncio.sleep(0)
+            finally:
+                state["closed"] += 1
+
+        return chunks()
+
+    return open_stream, state
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def drain(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_late_subscriber_replays_from_the_start():
+    async def scenario():
+        fanout = StreamFanout("test")
+        gate = asyncio.Event()
+        open_stream, state = upstream(count=3, gate=gate, gate_after=2)
+
+        first = await fanout.subscribe("key", open_stream)
+        assert [await first.__anext__(), await first.__anext__()] == [b"0", b"1"]
+
+        second = await fanout.subscribe("key", open_stream)
+        gate.set()
+        assert await drain(second) == [b"0", b"1", b"2"]
+        assert await drain(first) == [b"2"]
+        assert state["opened"] == 1
+        assert "key" not in fanout._inflight
+
+    asyncio.run(scenario())
+
+
+def test_buffer_is_bounded_by_the_slowest_subscriber(monkeypatch):
+    monkeypatch.setattr(coalescing, "STREAM_FANOUT_MAX_CHUNKS", 4)
+
+    async def scenario():
+        fanout = StreamFanout("test")
+        open_stream, state = upstream()
+
+        slow = await fanout.subscribe("key", open_stream)
+        shared = fanout._inflight["key"]
+        await settle()
+        # The producer waits for the subscriber instead of buffering ahead
+        assert state["produced"] == 4
+
+        for _ in range(10):
+            await slow.__anext__()
+        assert len(shared.chunks) <= 5
+        assert "key" not in fanout._inflight
+
+        # The start has been dropped, so a newcomer opens its own stream
+        late = await fanout.subscribe("key", open_stream)
+        assert await late.__anext__() == b"0"
+        assert state["opened"] == 2
+
+        await slow.aclose()
+        await late.aclose()
+        await settle()
+        assert state["closed"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_upstream_is_cancelled_when_the_last_subscriber_leaves():
+    async def scenario():
+        fanout = StreamFanout("test")
+        open_stream, state = upstream()
+
+        first = await fanout.subscribe("key", open_stream)
+        second = await fanout.subscribe("key", open_stream)
+        await first.__anext__()
+        await second.__anext__()
+
+        await first.aclose()
+        await settle()
+        assert state["closed"] == 0
+
+        await second.aclose()
+        await settle()
+        assert state["closed"] == 1
+        assert "key" not in fanout._inflight
+
+    asyncio.run(scenario())
+
+
+def test_response_dropped_before_iterating_releases_the_upstream():
+    async def scenario():
+        fanout = StreamFanout("test")
+        open_stream, state = upstream()
+
+        stream = await fanout.subscribe("key", open_stream)
+        del stream
+        gc.collect()
+        await settle()
+        assert state["closed"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+import pytest
+from functions.inference_executor import InferenceExecutor, InferenceQueueFull
+
+
+def test_cancelled_queued_job_releases_its_reservation():
+    async def scenario():
+        executor = InferenceExecutor(workers=1, queue_depth=1)
+        release = threading.Event()
+        try:
+            running = asyncio.ensure_future(executor.run(release.wait))
+            while executor.running == 0:
+                await asyncio.sleep(0.01)
+
+            queued = asyncio.ensure_future(executor.run(lambda: "never"))
+            await asyncio.sleep(0.01)
+            assert executor.queue_depth == 1
+            with pytest.raises(InferenceQueueFull):
+                await executor.run(lambda: "rejected")
+
+            queued.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+            assert executor.queue_depth == 0
+
+            # The freed slot can be used again
+            again = asyncio.ensure_future(executor.run(lambda: "ran"))
+            await asyncio.sleep(0.01)
+            release.set()
+            assert await running is True
+            assert await again == "ran"
+            assert (executor.running, executor.queue_depth) == (0, 0)
+        finally:
+            release.set()
+            executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+from functions.long_tts import _trim_mp3, split_text
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 144 * 128000 // 44100 bytes
+FRAME_HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+
+
+def frame(fill: bytes = b"\x00") -> bytes:
+    return FRAME_HEADER + fill * (FRAME_LENGTH - len(FRAME_HEADER))
+
+
+def id3_tag(body: bytes = b"\x00" * 20) -> bytes:
+    size = len(body)
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x04\x00\x00" + synchsafe + body
+
+
+def test_split_text_leads_with_one_sentence_and_respects_the_limit():
+    text = " ".join(f"Sentence number {i} is here." for i in range(20))
+    chunks = split_text(text, max_chars=80)
+    assert chunks[0] == "Sentence number 0 is here."
+    assert all(len(chunk) <= 80 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+def test_split_text_never_joins_paragraphs():
+    chunks = split_text("First one. Second one.\n\nThird one.", max_chars=400)
+    assert chunks == ["First one.", "Second one.", "Third one."]
+
+
+def test_split_text_keeps_an_overlong_sentence_whole():
+    long_sentence = "word " * 50 + "end."
+    chunks = split_text(f"Short start. {long_sentence} Short end.", max_chars=40)
+    assert long_sentence in chunks
+    assert chunks[-1] == "Short end."
+
+
+def test_trim_mp3_keeps_only_the_first_chunks_id3_tag():
+    tag = id3_tag()
+    data = tag + frame() + frame()
+    assert _trim_mp3(data, first=True) == data
+    assert _trim_mp3(data, first=False) == frame() + frame()
+
+
+def test_trim_mp3_drops_the_xing_frame_and_trailing_partial_frame():
+    xing = FRAME_HEADER + b"\x00" * 32 + b"Xing" + b"\x00" * (FRAME_LENGTH - 40)
+    data = xing + frame(b"\x01") + frame(b"\x02") + frame()[:100]
+    assert _trim_mp3(data, first=False) == frame(b"\x01") + frame(b"\x02")
+
+
+def test_trim_mp3_skips_garbage_before_the_first_frame():
+    assert _trim_mp3(b"\x00\x01junk" + frame(), first=False) == frame()
+
+
+def test_trim_mp3_leaves_unparseable_data_to_the_first_chunk_only():
+    assert _trim_mp3(b"not audio", first=True) == b"not audio"
+    assert _trim_mp3(b"not audio", first=False) == b""
@@ -0,0 +1,31 @@
+from functions.audio import SAMPLE_RATE
+from functions.longform import stitch_chunks
+
+
+def chunk(*spans):
+    return {"segments": [{"id": 0, "start": start, "end": end, "text": f"{start}-{end}"} for start, end in spans]}
+
+
+def seconds(*pairs):
+    return [(start * SAMPLE_RATE, end * SAMPLE_RATE) for start, end in pairs]
+
+
+def test_overlapping_segments_are_kept_once_on_their_side_of_the_midpoint():
+    # Overlaps of 60-62s and 120-122s, with midpoints at 61s and 121s
+    bounds = seconds((0, 62), (60, 122), (120, 150))
+    chunks = [
+        chunk((0, 30), (30, 58), (58, 61.5), (60.5, 62)),
+        chunk((59, 60.5), (60.5, 62), (62, 100), (100, 121.5), (121, 122)),
+        chunk((121, 122), (122, 150)),
+    ]
+    merged = stitch_chunks(chunks, bounds)
+    assert [(segment["start"], segment["end"]) for segment in merged] == [
+        (0, 30), (30, 58), (58, 61.5), (60.5, 62), (62, 100), (100, 121.5), (121, 122), (122, 150)
+    ]
+    assert [segment["id"] for segment in merged] == list(range(len(merged)))
+
+
+def test_single_chunk_is_kept_whole():
+    merged = stitch_chunks([chunk((0, 5), (5, 9))], seconds((0, 10)))
+    assert [segment["text"] for segment in merged] == ["0-5", "5-9"]
+    assert [segment["id"] for segment in merged] == [0, 1]
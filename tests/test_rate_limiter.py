@@ -0,0 +1,71 @@
+import time
+import asyncio
+import pytest
+from functions.rate_limiter import UpstreamBusy, UpstreamGovernor
+
+
+def test_waiting_projects_are_served_round_robin():
+    async def scenario():
+        governor = UpstreamGovernor(chars_per_minute=0, max_concurrency=1, max_wait=5)
+        granted = []
+
+        async def request(name, project):
+            async with governor.slot(project):
+                granted.append(name)
+                await asyncio.sleep(0)
+
+        holder = await governor.acquire("a")
+        tasks = [
+            asyncio.ensure_future(request(name, project))
+            for name, project in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")]
+        ]
+        await asyncio.sleep(0)
+        holder.release()
+        await asyncio.gather(*tasks)
+        assert granted == ["a1", "b1", "a2", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_character_budget_delays_until_tokens_refill():
+    async def scenario():
+        governor = UpstreamGovernor(chars_per_minute=6000, max_concurrency=10, max_wait=5)
+        (await governor.acquire(chars=6000)).release()
+        started = time.monotonic()
+        (await governor.acquire(chars=20)).release()
+        # 20 characters at 100 per second
+        assert time.monotonic() - started >= 0.15
+
+    asyncio.run(scenario())
+
+
+def test_estimated_wait_counts_queued_and_own_characters():
+    async def scenario():
+        governor = UpstreamGovernor(chars_per_minute=60, max_concurrency=10, max_wait=0.05)
+        await governor.acquire(chars=60)
+        queued = asyncio.ensure_future(governor.acquire(chars=10))
+        await asyncio.sleep(0)
+        # 10 queued characters plus 5 of our own at one per second
+        assert governor._estimated_wait(5) == pytest.approx(15, abs=0.5)
+        with pytest.raises(UpstreamBusy) as busy:
+            await queued
+        assert busy.value.retry_after == 10
+
+    asyncio.run(scenario())
+
+
+def test_upstream_429_pauses_dispatch():
+    async def scenario():
+        governor = UpstreamGovernor(chars_per_minute=0, max_concurrency=10, max_wait=0.05)
+        governor.throttled(30)
+        with pytest.raises(UpstreamBusy) as busy:
+            await governor.acquire()
+        assert busy.value.retry_after == 30
+
+        governor = UpstreamGovernor(chars_per_minute=0, max_concurrency=10, max_wait=5)
+        governor.throttled(0.2)
+        started = time.monotonic()
+        (await governor.acquire()).release()
+        assert time.monotonic() - started >= 0.15
+
+    asyncio.run(scenario())
@@ -0,0 +1,31 @@
+import pytest
+from functions import routing
+from functions.audio import estimate_duration
+
+
+@pytest.fixture(autouse=True)
+def no_history(monkeypatch):
+    monkeypatch.setattr(routing, "recent_rtf", lambda engine, model: None)
+    monkeypatch.setattr(routing, "ROUTING_WHISPER_PRIOR_RTF", 0.5)
+
+
+def test_estimate_duration_of_spooled_wav(wav_bytes, spooled_upload):
+    data = wav_bytes(10, rate=44100, channels=2)
+    assert estimate_duration(data) == pytest.approx(10.0)
+    with spooled_upload(data) as upload:
+        assert estimate_duration(upload) == pytest.approx(10.0)
+        assert upload.tell() == 0
+
+
+def test_short_wav_upload_stays_on_requested_model(wav_bytes, spooled_upload):
+    with spooled_upload(wav_bytes(10, rate=44100, channels=2)) as upload:
+        route = routing.choose_route(upload, "turbo", "scribe_v1", target_seconds=30)
+    assert (route.engine, route.model, route.reason) == ("whisper", "turbo", "preferred")
+    assert route.estimated_seconds == pytest.approx(5.0)
+
+
+def test_long_wav_upload_moves_to_small_model(monkeypatch, wav_bytes, spooled_upload):
+    monkeypatch.setattr(routing, "recent_rtf", lambda engine, model: 0.05 if model == "base" else None)
+    with spooled_upload(wav_bytes(120)) as upload:
+        route = routing.choose_route(upload, "turbo", "scribe_v1", target_seconds=30)
+    assert (route.engine, route.model, route.reason) == ("whisper", "base", "target")
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from functions import transcription
+from functions.audio import SAMPLE_RATE
+from functions.transcription import VAD_GAP_SECONDS, compact_speech, restore_timeline
+
+
+class FakeModel:
+    """Records whether two transcriptions ever ran on it at the same time"""
+
+    def __init__(self):
+        self.active = 0
+        self.overlapped = False
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, **options):
+        with self._lock:
+            self.active += 1
+            self.overlapped |= self.active > 1
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return {"text": "tone", "segments": [], "language": "en"}
+
+
+def test_concurrent_transcriptions_do_not_share_a_model_at_once(monkeypatch, wav_bytes):
+    model = FakeModel()
+    monkeypatch.setattr(transcription, "get_whisper_model", lambda *args, **kwargs: model)
+    monkeypatch.setattr(transcription, "get_device", lambda: "cpu")
+    monkeypatch.setattr(transcription, "WHISPER_BATCHING", False)
+    audio = wav_bytes(1)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(
+            lambda i: transcription.transcribe_with_whisper(audio, f"{i}.wav", "tiny", precision="fp32", vad=False),
+            range(4),
+        ))
+
+    assert [result["text"] for result in results] == ["tone"] * 4
+    assert not model.overlapped
+
+
+def test_model_lock_is_per_instance():
+    first, second = FakeModel(), FakeModel()
+    assert transcription.model_lock(first) is transcription.model_lock(first)
+    assert transcription.model_lock(first) is not transcription.model_lock(second)
+
+
+def test_compact_speech_joins_regions_with_gaps():
+    audio = np.ones(5 * SAMPLE_RATE, dtype=np.float32)
+    compact, time_map = compact_speech(audio, [(0, SAMPLE_RATE), (3 * SAMPLE_RATE, 4 * SAMPLE_RATE)])
+    assert len(compact) == 2 * SAMPLE_RATE + int(VAD_GAP_SECONDS * SAMPLE_RATE)
+    assert time_map == [(0.0, 0.0, 1.0), (1.0 + VAD_GAP_SECONDS, 3.0, 1.0)]
+
+
+def test_restore_timeline_maps_segments_and_words_back():
+    time_map = [(0.0, 0.5, 1.0), (1.0 + VAD_GAP_SECONDS, 3.0, 1.0)]
+    segments = [
+        {"start": 0.25, "end": 1.1, "words": [{"start": 0.25, "end": 0.75}]},
+        {"start": 1.5, "end": 2.3, "words": [{"start": 1.5, "end": 2.0}]},
+    ]
+    restore_timeline(segments, time_map)
+    # A time inside the joining gap lands at the end of the region before it
+    assert (segments[0]["start"], segments[0]["end"]) == (0.75, 1.5)
+    assert segments[0]["words"][0] == {"start": 0.75, "end": 1.25}
+    assert (segments[1]["start"], segments[1]["end"]) == (pytest.approx(3.2), pytest.approx(4.0))
+    assert segments[1]["words"][0] == {"start": pytest.approx(3.2), "end": pytest.approx(3.7)}